@@ -59,6 +59,1477 @@ from gpu_extras.batch import batch_for_shader
 from . import morpheas_tools
 import pdb
 import math
+import os
+import numpy
+import weakref
+from mathutils import Matrix
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# PyPNG is only needed to decode textures in the background, see
+# TextureCache.asynchronous.
+try:
+    from . import png
+except ImportError:
+    png = None
+
+
+class GPUState:
+    """
+    GPUState keeps track of the GPU state set while a World draws, so calls
+    that would set something to the value it already has are skipped. All
+    drawing of Morpheas goes through it: blending, binding shaders, setting
+    uniforms and textures, and the size and color of blf fonts.
+    Blender draws other things between our frames, so nothing is assumed
+    about the state when a frame begins. The same goes for drawing that
+    doesn't go through the tracker, like blf, call forget() after it. blf
+    keeps its font state apart from the GPU, so that is still known after
+    forget().
+    """
+
+    # Builtin shaders by name, so they are looked up only once.
+    builtin_shaders = {}
+
+    def __init__(self):
+        # How many calls were sent to the GPU and how many were skipped
+        # during the current frame, by kind: 'blend', 'shader', 'uniform'
+        # 'texture' and 'font'.
+        self.issued = {'blend': 0, 'shader': 0, 'uniform': 0, 'texture': 0, 'font': 0}
+        self.skipped = {'blend': 0, 'shader': 0, 'uniform': 0, 'texture': 0, 'font': 0}
+
+        # The size and color set for each blf font id, (size, dpi) for the
+        # (font_id, 'size') key and the color for the (font_id, 'color') key.
+        self.fonts = {}
+
+        # The rectangles drawing is clipped to, each already cut by the one
+        # below it, in region coordinates, and where the region is in what is
+        # drawn to, see push_scissor().
+        self.scissors = []
+        self.scissor_origin = (0, 0)
+
+        self.forget()
+
+    def forget(self):
+        """
+        Forget everything known about the GPU state, the next calls are
+        sent no matter what.
+        """
+        # None means unknown.
+        self.blend = None
+        self.bound_shader = None
+        self.uniforms = {}
+        self.sampler = None
+
+    def begin(self):
+        """
+        Start a frame, blending stays enabled until end().
+        """
+        for kind in self.issued:
+            self.issued[kind] = 0
+            self.skipped[kind] = 0
+        self.fonts = {}
+        self.scissors = []
+        self.scissor_origin = (0, 0)
+        self.forget()
+        self.set_blend(True)
+
+    def end(self):
+        """
+        End a frame and leave blending disabled, the way Blender expects it.
+        """
+        self.set_blend(False)
+        self.forget()
+        self.fonts = {}
+        if len(self.scissors) > 0:
+            self.scissors = []
+            self.apply_scissor()
+
+    def set_blend(self, mode):
+        """
+        Set how drawing blends with what is below it: False to not blend,
+        True for colors with straight alpha and 'PREMULTIPLIED' for colors
+        already multiplied by their alpha, like the images of render caches.
+        """
+        if self.blend == mode:
+            self.skipped['blend'] += 1
+            return
+        if hasattr(gpu, 'state'):
+            # Its alpha blending adds up alpha correctly, so what is drawn
+            # into a GPUOffScreen ends up premultiplied.
+            gpu.state.blend_set({False: 'NONE', True: 'ALPHA',
+                                 'PREMULTIPLIED': 'ALPHA_PREMULT'}[mode])
+        elif mode:
+            bgl.glEnable(bgl.GL_BLEND)
+            bgl.glBlendFunc(bgl.GL_ONE if mode == 'PREMULTIPLIED' else bgl.GL_SRC_ALPHA,
+                            bgl.GL_ONE_MINUS_SRC_ALPHA)
+        else:
+            bgl.glDisable(bgl.GL_BLEND)
+        self.blend = mode
+        self.issued['blend'] += 1
+
+    def shader(self, name):
+        """
+        Return the builtin shader with the given name.
+        """
+        shader = self.builtin_shaders.get(name)
+        if shader is None:
+            shader = gpu.shader.from_builtin(name)
+            self.builtin_shaders[name] = shader
+        return shader
+
+    def bind(self, shader):
+        if self.bound_shader is shader:
+            self.skipped['shader'] += 1
+            return
+        shader.bind()
+        self.bound_shader = shader
+        self.issued['shader'] += 1
+
+    def uniform_float(self, shader, name, value):
+        """
+        Set a float uniform of a shader, shader must be bound.
+        """
+        key = (shader, name)
+        if key in self.uniforms and self.uniforms[key] == value:
+            self.skipped['uniform'] += 1
+            return
+        shader.uniform_float(name, value)
+        self.uniforms[key] = value
+        self.issued['uniform'] += 1
+
+    def uniform_sampler(self, shader, name, texture):
+        """
+        Bind a texture to a sampler of a shader, shader must be bound. There is
+        only one texture unit in use, so any other texture replaces it.
+        """
+        sampler = (shader, name, texture)
+        if self.sampler == sampler:
+            self.skipped['texture'] += 1
+            return
+        shader.uniform_sampler(name, texture)
+        self.sampler = sampler
+        self.issued['texture'] += 1
+
+    def font_size(self, font_id, size, dpi):
+        """
+        Set the size of a blf font.
+        """
+        key = (font_id, 'size')
+        value = (size, dpi)
+        if self.fonts.get(key) == value:
+            self.skipped['font'] += 1
+            return
+        blf.size(font_id, size, dpi)
+        self.fonts[key] = value
+        self.issued['font'] += 1
+
+    def font_color(self, font_id, color):
+        """
+        Set the color of a blf font, color is RGBA.
+        """
+        key = (font_id, 'color')
+        value = tuple(color)
+        if self.fonts.get(key) == value:
+            self.skipped['font'] += 1
+            return
+        blf.color(font_id, value[0], value[1], value[2], value[3])
+        self.fonts[key] = value
+        self.issued['font'] += 1
+
+    def push_scissor(self, x1, y1, x2, y2):
+        """
+        Clip drawing to the rectangle [x1, y1, x2, y2] of the region, and to
+        the rectangle clipping it already, until pop_scissor().
+        """
+        if len(self.scissors) > 0:
+            top = self.scissors[-1]
+            x1 = max(x1, top[0])
+            y1 = max(y1, top[1])
+            x2 = min(x2, top[2])
+            y2 = min(y2, top[3])
+        self.scissors.append((x1, y1, max(x1, x2), max(y1, y2)))
+        self.apply_scissor()
+
+    def pop_scissor(self):
+        """
+        Stop clipping to the last rectangle pushed.
+        """
+        self.scissors.pop()
+        self.apply_scissor()
+
+    def apply_scissor(self):
+        """
+        Internal, clip to the last rectangle pushed, or not at all.
+        """
+        if len(self.scissors) == 0:
+            bgl.glDisable(bgl.GL_SCISSOR_TEST)
+            return
+        x1, y1, x2, y2 = self.scissors[-1]
+        x1 -= self.scissor_origin[0]
+        x2 -= self.scissor_origin[0]
+        y1 -= self.scissor_origin[1]
+        y2 -= self.scissor_origin[1]
+        x = int(math.floor(x1))
+        y = int(math.floor(y1))
+        bgl.glScissor(x, y, int(math.ceil(x2)) - x, int(math.ceil(y2)) - y)
+        bgl.glEnable(bgl.GL_SCISSOR_TEST)
+
+    def stats(self):
+        """
+        Return how many calls were sent and skipped during the current frame.
+        """
+        return {'issued': dict(self.issued), 'skipped': dict(self.skipped)}
+
+
+class Renderer:
+    """
+    The Renderer is owned by the World and collects the geometry of all morphs
+    drawn during a frame. Instead of building a batch and issuing a draw call
+    for each morph, shapes are appended to a single vertex buffer and drawn
+    together with one call.
+    Solid color shapes (rectangles, rounded rectangles and circles) get a
+    color per vertex, so all of them go in the same buffer. Textured shapes
+    get texture coordinates instead and consecutive shapes using the same
+    texture go in the same buffer, which is why texture atlases help so much.
+    Morphs are still drawn parent before child, so whenever a shape can't
+    join the buffer (different texture, solid after textured) the buffer is
+    drawn first to keep the painter's order correct.
+    If use_sdf is True, shapes are not turned into triangles at all. Every
+    rectangle, rounded rectangle and circle, textured or not, becomes a
+    single quad and the shape shader cuts its corners using the signed
+    distance to its edge, which also smooths the edges. Solid and textured
+    shapes can then share a buffer as long as they use the same texture.
+    Morphs add themselves with add_instance. Consecutive morphs with the same
+    shape, size and texture, like the cells of a grid or a palette, form a run,
+    and long runs are drawn with a single instanced draw call of the instance
+    shader, which only needs the position, color and uv rectangle of each.
+    Text is drawn by blf, not through the buffer. Labels are collected by
+    add_text and drawn together after the shapes, grouped by font and size, so
+    blf changes its state once per group instead of once per label. Shapes
+    added after a label go below it too, unless they cover it, then what was
+    collected is drawn first, see cover().
+    """
+
+    # Runs of at least this many identical shapes are drawn instanced.
+    instancing_threshold = 16
+
+    # The instance data texture has a row of texels for this many instances.
+    instances_per_row = 256
+
+    # The size of the cells the rectangles of waiting labels are kept by.
+    label_cell_size = 64
+
+    # The shape shader used when use_sdf is True. The fragment shader must
+    # agree with morpheas_tools.shapeDistance, which hit-testing uses.
+    shape_vertex_shader = '''
+        uniform mat4 ModelViewProjectionMatrix;
+
+        in vec2 pos;
+        in vec2 local;
+        in vec2 size;
+        in vec4 radii;
+        in vec4 color;
+        in vec2 texCoord;
+        in float textured;
+
+        out vec2 v_local;
+        out vec2 v_size;
+        out vec4 v_radii;
+        out vec4 v_color;
+        out vec2 v_texCoord;
+        out float v_textured;
+
+        void main()
+        {
+            v_local = local;
+            v_size = size;
+            v_radii = radii;
+            v_color = color;
+            v_texCoord = texCoord;
+            v_textured = textured;
+            gl_Position = ModelViewProjectionMatrix * vec4(pos, 0.0, 1.0);
+        }
+    '''
+
+    shape_fragment_shader = '''
+        uniform sampler2D image;
+
+        in vec2 v_local;
+        in vec2 v_size;
+        in vec4 v_radii;
+        in vec4 v_color;
+        in vec2 v_texCoord;
+        in float v_textured;
+
+        out vec4 fragColor;
+
+        void main()
+        {
+            /* Radii are lower left, upper left, upper right, lower right. */
+            vec2 halfSize = v_size * 0.5;
+            vec2 p = v_local - halfSize;
+            float radius = p.x < 0.0 ? (p.y < 0.0 ? v_radii.x : v_radii.y)
+                                     : (p.y > 0.0 ? v_radii.z : v_radii.w);
+            radius = min(radius, min(halfSize.x, halfSize.y));
+            vec2 q = abs(p) - halfSize + radius;
+            float distance = min(max(q.x, q.y), 0.0) + length(max(q, 0.0)) - radius;
+
+            /* Anti-aliasing, fade out over the pixel the edge goes through. */
+            float coverage = clamp(0.5 - distance, 0.0, 1.0);
+
+            vec4 color = v_textured > 0.5 ? texture(image, v_texCoord) : v_color;
+            fragColor = vec4(color.rgb, color.a * coverage);
+        }
+    '''
+
+    # The instance shader, drawing the same shape many times. The position,
+    # color and uv rectangle of each instance are 3 texels of the instances
+    # texture. The shape is either a quad cut like the shape shader does
+    # (cut is 1.0) or the triangles of the outline of the shape.
+    instance_vertex_shader = '''
+        uniform mat4 ModelViewProjectionMatrix;
+        uniform sampler2D instances;
+        uniform vec2 size;
+
+        in vec2 local;
+
+        out vec2 v_local;
+        out vec4 v_color;
+        out vec2 v_texCoord;
+
+        void main()
+        {
+            ivec2 base = ivec2((gl_InstanceID %% %d) * 3, gl_InstanceID / %d);
+            vec4 place = texelFetch(instances, base, 0);
+            vec4 uvRect = texelFetch(instances, base + ivec2(2, 0), 0);
+            v_color = texelFetch(instances, base + ivec2(1, 0), 0);
+            v_local = local;
+            v_texCoord = uvRect.xy + local / size * (uvRect.zw - uvRect.xy);
+            gl_Position = ModelViewProjectionMatrix * vec4(place.xy + local, 0.0, 1.0);
+        }
+    ''' % (instances_per_row, instances_per_row)
+
+    instance_fragment_shader = '''
+        uniform sampler2D image;
+        uniform vec2 size;
+        uniform vec4 radii;
+        uniform float cut;
+        uniform float textured;
+
+        in vec2 v_local;
+        in vec4 v_color;
+        in vec2 v_texCoord;
+
+        out vec4 fragColor;
+
+        void main()
+        {
+            float coverage = 1.0;
+            if (cut > 0.5) {
+                /* The same as the shape shader. */
+                vec2 halfSize = size * 0.5;
+                vec2 p = v_local - halfSize;
+                float radius = p.x < 0.0 ? (p.y < 0.0 ? radii.x : radii.y)
+                                         : (p.y > 0.0 ? radii.z : radii.w);
+                radius = min(radius, min(halfSize.x, halfSize.y));
+                vec2 q = abs(p) - halfSize + radius;
+                float distance = min(max(q.x, q.y), 0.0) + length(max(q, 0.0)) - radius;
+                coverage = clamp(0.5 - distance, 0.0, 1.0);
+            }
+
+            vec4 color = textured > 0.5 ? texture(image, v_texCoord) : v_color;
+            fragColor = vec4(color.rgb, color.a * coverage);
+        }
+    '''
+
+    def __init__(self, use_sdf=False, state=None, use_instancing=True):
+        # Draw shapes as quads cut by the shape shader, see add_shape.
+        self.use_sdf = use_sdf
+        self.shape_shader = None
+
+        # Draw long runs of identical shapes instanced, if this version of
+        # Blender can, see add_instance.
+        self.use_instancing = use_instancing and hasattr(
+            getattr(gpu.types, 'GPUBatch', None), 'draw_instanced')
+        self.instance_shader = None
+
+        # The current run: the key and the shape shared by its instances, and
+        # the position, color, uv rectangle and texture coordinates of each
+        # instance.
+        self.run_key = None
+        self.run_shape = None
+        self.run = []
+
+        # The instance data textures of the runs drawn during the last frame
+        # and the current one, by their data. Runs that haven't changed since
+        # the last frame, which is most of them, reuse their texture.
+        self.instance_textures = {}
+        self.last_instance_textures = {}
+
+        # The labels waiting to be drawn by blf, as (font_id, size, dpi, x, y,
+        # color, text), and the rectangle [x1, y1, x2, y2] each covers, also
+        # by the cells of label_cell_size it overlaps, see cover().
+        self.labels = []
+        self.label_boxes = []
+        self.label_cells = {}
+
+        # Every GPU call goes through the state tracker, so calls that change
+        # nothing are skipped. Usually the one of the World.
+        self.state = GPUState() if state is None else state
+
+        # True between begin() and end(). Outside of a frame every shape
+        # is drawn immediately, so morphs can still be drawn on their own.
+        self.in_frame = False
+
+        # The number of draw calls issued during the current frame. Useful
+        # to make sure batching works as expected.
+        self.draw_calls = 0
+
+        self.clear()
+
+    def begin(self):
+        """
+        Start collecting geometry for a new frame.
+        """
+        self.clear()
+        self.in_frame = True
+        self.draw_calls = 0
+        self.last_instance_textures = self.instance_textures
+        self.instance_textures = {}
+
+    def end(self):
+        """
+        Draw whatever is left and stop collecting geometry.
+        """
+        self.flush()
+        self.in_frame = False
+
+    def clear(self):
+        # What the buffer holds: None when empty, 'color' for solid color
+        # triangles, 'texture' for textured triangles and 'shape' for shapes.
+        self.kind = None
+
+        # The texture used by the geometry in the buffer, if any, and whether
+        # its colors are premultiplied by alpha, see add_textured_region.
+        self.texture = None
+        self.premultiplied = False
+
+        # The geometry collected since the last flush, as lists of NumPy
+        # arrays, one per shape: vertex positions, triangle indices and
+        # either vertex colors or texture coordinates. They are joined into
+        # a single array of each when flushed.
+        self.positions = []
+        self.colors = []
+        self.tex_coords = []
+        self.indices = []
+        self.vertex_count = 0
+
+        # Shapes for the shape shader, one row of 17 numbers per shape:
+        # x, y, width, height, 4 radii, 4 color components, the uv rectangle
+        # and 1.0 if textured. They become 4 vertices each when flushed.
+        self.shapes = []
+
+    def add_instance(self, key, outline, width, height, radii, x, y, color,
+                     texture=None, uv_rect=None, tex_coords=None):
+        """
+        Add a shape that may be the same as the shapes added before it. key
+        is anything hashable that is equal for shapes that are the same,
+        like their size and corners. outline is the local outline of the
+        shape, not needed if use_sdf is True, width, height and radii are
+        like for add_shape, (x, y) is where the shape goes. If texture is
+        given, uv_rect [u1, v1, u2, v2] is the part of it that covers the shape
+        and tex_coords the texture coordinates of each point of outline.
+        Consecutive shapes with the same key and texture are collected and,
+        if there are enough of them, drawn instanced, else added one by one.
+        """
+        if len(self.labels) > 0:
+            self.cover(x, y, x + width, y + height)
+        if not (self.in_frame and self.use_instancing):
+            self.add_single(outline, width, height, radii, x, y, color,
+                            texture, uv_rect, tex_coords)
+            return
+
+        key = (key, texture)
+        if key != self.run_key:
+            self.end_run()
+            self.run_key = key
+            self.run_shape = (outline, width, height, radii, texture)
+        self.run.append((x, y, color, uv_rect, tex_coords))
+
+    def add_single(self, outline, width, height, radii, x, y, color,
+                   texture, uv_rect, tex_coords):
+        """
+        Internal, add one shape of add_instance to the buffer.
+        """
+        if self.use_sdf:
+            self.add_shape(x, y, width, height, radii, color, texture, uv_rect)
+        elif texture is None:
+            self.add_region(outline, color, (x, y))
+        else:
+            self.add_textured_region(outline, tex_coords, texture, (x, y))
+
+    def end_run(self):
+        """
+        Draw the current run, instanced if it's long enough.
+        """
+        run = self.run
+        if len(run) == 0:
+            return
+        outline, width, height, radii, texture = self.run_shape
+        self.run = []
+        self.run_key = None
+        self.run_shape = None
+
+        # The shapes of the run were added before the waiting labels or don't
+        # cover them, they go below all of them.
+        labels = self.labels
+        self.labels = []
+        if len(run) < self.instancing_threshold or width <= 0 or height <= 0:
+            for x, y, color, uv_rect, tex_coords in run:
+                self.add_single(outline, width, height, radii, x, y, color,
+                                texture, uv_rect, tex_coords)
+        else:
+            self.draw_run(run, outline, width, height, radii, texture)
+        self.labels = labels
+
+    def draw_run(self, run, outline, width, height, radii, texture):
+        """
+        Internal, draw a run with a single instanced draw call.
+        """
+        # What was added before the run is below it.
+        self.draw_buffer()
+
+        if self.use_sdf:
+            mesh = numpy.array(((0, 0), (width, 0), (width, height), (0, height)),
+                               dtype=numpy.float32)
+        else:
+            mesh = numpy.asarray(outline, dtype=numpy.float32)
+        indices = morpheas_tools.fanIndices(len(mesh))
+
+        # Position, color and uv rectangle of each instance, one texel each.
+        count = len(run)
+        per_row = self.instances_per_row
+        rows = (count + per_row - 1) // per_row
+        data = numpy.zeros((rows * per_row, 3, 4), dtype=numpy.float32)
+        data[:count, 0, :2] = [instance[0:2] for instance in run]
+        data[:count, 1] = [instance[2] for instance in run]
+        if texture is not None:
+            data[:count, 2] = [instance[3] for instance in run]
+        data_key = (rows, data.tobytes())
+        instances = self.last_instance_textures.pop(data_key, None)
+        if instances is None:
+            instances = self.instance_textures.get(data_key)
+        if instances is None:
+            instances = create_texture(per_row * 3, rows, data, format='RGBA32F')
+        self.instance_textures[data_key] = instances
+
+        if self.instance_shader is None:
+            self.instance_shader = gpu.types.GPUShader(
+                self.instance_vertex_shader, self.instance_fragment_shader)
+        shader = self.instance_shader
+        batch = batch_for_shader(shader, 'TRIS', {"local": mesh}, indices=indices)
+
+        state = self.state
+        state.set_blend(True)
+        state.bind(shader)
+        state.uniform_float(
+            shader, "ModelViewProjectionMatrix",
+            gpu.matrix.get_projection_matrix() @ gpu.matrix.get_model_view_matrix())
+        state.uniform_float(shader, "size", (width, height))
+        state.uniform_float(shader, "radii", tuple(radii))
+        state.uniform_float(shader, "cut", 1.0 if self.use_sdf else 0.0)
+        state.uniform_float(shader, "textured", 0.0 if texture is None else 1.0)
+        state.uniform_sampler(shader, "instances", instances)
+        if texture is not None:
+            state.uniform_sampler(shader, "image", texture)
+        batch.draw_instanced(shader, instance_count=count)
+        self.draw_calls += 1
+
+    def add_region(self, points, color, offset=(0, 0)):
+        """
+        Add a convex shape given as the outline points of a triangle fan,
+        the same points drawRegion of morpheas_tools expects, as a sequence
+        of (x, y) or an (N, 2) array.
+        offset moves the shape, so morphs can keep their shape in local
+        coordinates and only tell the renderer where it is.
+        """
+        if len(self.run) > 0:
+            self.end_run()
+        points = numpy.asarray(points, dtype=numpy.float32)
+        if len(points) < 3:
+            return
+        if len(self.labels) > 0:
+            self.cover_points(points, offset)
+        if self.kind != 'color':
+            self.draw_buffer()
+
+        self.kind = 'color'
+        self.colors.append(numpy.broadcast_to(
+            numpy.asarray(color, dtype=numpy.float32), (len(points), 4)))
+        self.add_points(points, offset)
+
+        if not self.in_frame:
+            self.flush()
+
+    def add_textured_region(self, points, tex_coords, texture, offset=(0, 0),
+                            premultiplied=False):
+        """
+        Add a convex textured shape, the outline points of a triangle fan
+        and the texture coordinates of each point. texture is a GPUTexture,
+        premultiplied is True if its colors are already multiplied by alpha,
+        like the image of a GPUOffScreen drawn into with alpha blending.
+        """
+        if len(self.run) > 0:
+            self.end_run()
+        points = numpy.asarray(points, dtype=numpy.float32)
+        if len(points) < 3:
+            return
+        if len(self.labels) > 0:
+            self.cover_points(points, offset)
+        if (self.kind != 'texture' or self.texture is not texture or
+                self.premultiplied != premultiplied):
+            self.draw_buffer()
+
+        self.kind = 'texture'
+        self.texture = texture
+        self.premultiplied = premultiplied
+        self.tex_coords.append(numpy.asarray(tex_coords, dtype=numpy.float32))
+        self.add_points(points, offset)
+
+        if not self.in_frame:
+            self.flush()
+
+    def add_shape(self, x, y, width, height, radii, color, texture=None, uv_rect=None):
+        """
+        Add a rectangle with its lower left corner at (x, y), with the corners
+        rounded by radii [lower_left, upper_left, upper_right, lower_right].
+        A circle is a square with all radii half its width. If texture is
+        given, uv_rect [u1, v1, u2, v2] is the part of it that covers the shape
+        and color is ignored. Needs use_sdf.
+        """
+        if len(self.run) > 0:
+            self.end_run()
+        if len(self.labels) > 0:
+            self.cover(x, y, x + width, y + height)
+        if self.kind != 'shape' or (texture is not None and
+                                    self.texture is not None and self.texture is not texture):
+            self.draw_buffer()
+        self.kind = 'shape'
+        if texture is not None:
+            self.texture = texture
+            u1, v1, u2, v2 = uv_rect
+            textured = 1.0
+        else:
+            u1 = v1 = u2 = v2 = 0.0
+            textured = 0.0
+
+        self.shapes.append((
+            x, y, width, height, radii[0], radii[1], radii[2], radii[3],
+            color[0], color[1], color[2], color[3], u1, v1, u2, v2, textured))
+
+        if not self.in_frame:
+            self.flush()
+
+    def add_points(self, points, offset):
+        """
+        Internal, add the positions and triangle indices of a fan.
+        """
+        ox, oy = offset
+        if ox or oy:
+            points = points + numpy.array((ox, oy), dtype=numpy.float32)
+        self.positions.append(points)
+        self.indices.append(morpheas_tools.fanIndices(len(points)) + self.vertex_count)
+        self.vertex_count += len(points)
+
+    def add_text(self, font_id, size, dpi, x, y, color, text, width=None, height=None):
+        """
+        Add a label, text drawn by blf with its baseline starting at (x, y).
+        width and height are the dimensions of the text, measured with blf if
+        not given. The label is drawn over the shapes collected with it.
+        """
+        if not self.in_frame:
+            self.flush()
+            self.labels.append((font_id, size, dpi, x, y, color, text))
+            self.draw_labels()
+            return
+
+        if width is None or height is None:
+            self.state.font_size(font_id, size, dpi)
+            width, height = blf.dimensions(font_id, text)
+        self.labels.append((font_id, size, dpi, x, y, color, text))
+
+        # The text can reach below the baseline.
+        box = (x, y - height, x + width, y + height)
+        self.label_boxes.append(box)
+        cell_size = self.label_cell_size
+        for column in range(int(box[0] // cell_size), int(box[2] // cell_size) + 1):
+            for row in range(int(box[1] // cell_size), int(box[3] // cell_size) + 1):
+                self.label_cells.setdefault((column, row), []).append(box)
+
+    def cover(self, x1, y1, x2, y2):
+        """
+        Internal, called before adding a shape covering the rectangle
+        [x1, y1, x2, y2] while labels are waiting. If the shape covers any of
+        them, everything collected is drawn first, so it goes over the label.
+        """
+        cell_size = self.label_cell_size
+        columns = range(int(x1 // cell_size), int(x2 // cell_size) + 1)
+        rows = range(int(y1 // cell_size), int(y2 // cell_size) + 1)
+        if len(columns) * len(rows) > len(self.label_boxes):
+            # Big shapes, like panels, are quicker to check against each label.
+            boxes = [self.label_boxes]
+        else:
+            boxes = [self.label_cells.get((column, row), ())
+                     for column in columns for row in rows]
+        for cell in boxes:
+            for box in cell:
+                if box[0] < x2 and x1 < box[2] and box[1] < y2 and y1 < box[3]:
+                    self.flush()
+                    return
+
+    def cover_points(self, points, offset):
+        """
+        Internal, cover() for the shape with the given outline points.
+        """
+        low = points.min(axis=0)
+        high = points.max(axis=0)
+        self.cover(low[0] + offset[0], low[1] + offset[1],
+                   high[0] + offset[0], high[1] + offset[1])
+
+    def draw_labels(self):
+        """
+        Draw the labels collected by add_text. Labels rarely overlap, so they
+        are drawn grouped by font and size rather than in the order they were
+        added, and the GPUState skips the blf calls that change nothing.
+        """
+        labels = self.labels
+        self.labels = []
+        self.label_boxes = []
+        self.label_cells = {}
+        labels.sort(key=lambda label: label[0:3])
+
+        state = self.state
+        for font_id, size, dpi, x, y, color, text in labels:
+            state.font_size(font_id, size, dpi)
+            state.font_color(font_id, color)
+            blf.position(font_id, x, y, 0)
+            blf.draw(font_id, text)
+
+        # blf binds its own shader and texture and changes blending.
+        state.forget()
+
+    def shape_vertices(self):
+        """
+        Internal, turn the collected shapes into the vertex attributes and
+        triangle indices of their quads.
+        """
+        shapes = numpy.array(self.shapes, dtype=numpy.float32)
+        count = len(shapes)
+        corners = numpy.array(((0, 0), (1, 0), (1, 1), (0, 1)), dtype=numpy.float32)
+
+        local = corners[None, :, :] * shapes[:, None, 2:4]
+        positions = local + shapes[:, None, 0:2]
+        tex_coords = shapes[:, None, 12:14] + corners[None, :, :] * (
+            shapes[:, None, 14:16] - shapes[:, None, 12:14])
+        quad = numpy.array(((0, 1, 2), (0, 2, 3)), dtype=numpy.int32)
+        indices = quad[None, :, :] + (4 * numpy.arange(count, dtype=numpy.int32))[:, None, None]
+
+        content = {
+            "pos": positions.reshape(-1, 2),
+            "local": local.reshape(-1, 2),
+            "size": numpy.repeat(shapes[:, 2:4], 4, axis=0),
+            "radii": numpy.repeat(shapes[:, 4:8], 4, axis=0),
+            "color": numpy.repeat(shapes[:, 8:12], 4, axis=0),
+            "texCoord": tex_coords.reshape(-1, 2),
+            "textured": numpy.repeat(shapes[:, 16], 4)}
+        return content, indices.reshape(-1, 3)
+
+    def flush(self):
+        """
+        Send all collected geometry to the GPU, then draw the labels over it.
+        """
+        if len(self.run) > 0:
+            self.end_run()
+        self.draw_buffer()
+        if len(self.labels) > 0:
+            self.draw_labels()
+
+    def draw_buffer(self):
+        """
+        Internal, send the geometry of the buffer to the GPU with a single
+        draw call, leaving the labels waiting.
+        """
+        if self.kind is None:
+            return
+
+        state = self.state
+        texture = self.texture
+        if self.kind == 'shape':
+            if self.shape_shader is None:
+                self.shape_shader = gpu.types.GPUShader(
+                    self.shape_vertex_shader, self.shape_fragment_shader)
+            shader = self.shape_shader
+            content, indices = self.shape_vertices()
+        else:
+            content = {"pos": numpy.concatenate(self.positions)}
+            indices = numpy.concatenate(self.indices)
+            if self.kind == 'color':
+                shader = state.shader('2D_SMOOTH_COLOR')
+                content["color"] = numpy.concatenate(self.colors)
+            else:
+                shader = state.shader('2D_IMAGE')
+                content["texCoord"] = numpy.concatenate(self.tex_coords)
+        batch = batch_for_shader(shader, 'TRIS', content, indices=indices)
+
+        # Inside a frame blending is already enabled by the World, unless
+        # something like blf turned it off.
+        state.set_blend('PREMULTIPLIED' if self.premultiplied else True)
+        state.bind(shader)
+        if self.kind == 'shape':
+            state.uniform_float(
+                shader, "ModelViewProjectionMatrix",
+                gpu.matrix.get_projection_matrix() @ gpu.matrix.get_model_view_matrix())
+        if texture is not None:
+            state.uniform_sampler(shader, "image", texture)
+        batch.draw(shader)
+        if not self.in_frame:
+            state.set_blend(False)
+        self.draw_calls += 1
+
+        self.clear()
+
+
+class TextureAtlas:
+    """
+    A TextureAtlas packs many PNG files into a few big textures, called pages.
+    Morphs whose textures are in the same page can be drawn by the Renderer
+    with a single draw call, and switching between textures of the same page
+    only changes the texture coordinates of the morph.
+    Build it with TextureCache.build_atlas so morphs use it automatically.
+    """
+
+    def __init__(self, max_size=2048, padding=1):
+        # The maximum width and height of a page.
+        self.max_size = max_size
+
+        # Empty pixels between packed textures, so that filtering does not
+        # bleed the pixels of one texture into its neighbours.
+        self.padding = padding
+
+        # The GPUTexture of each page and its [width, height].
+        self.pages = []
+        self.page_sizes = []
+
+        # Maps the resolved path of each packed PNG file to its page index
+        # and its rectangle in the page in pixels [x, y, width, height].
+        self.regions = {}
+
+    def pack(self, sizes):
+        """
+        Place rectangles given as a dictionary of key to [width, height] into
+        pages, using shelves: rows filled left to right, the tallest
+        rectangles first. Returns the key to [page, x, y] placements and the
+        [width, height] of each page. Rectangles that don't fit in a page are
+        left out.
+        """
+        padding = self.padding
+        placements = {}
+        pages = []
+        x = y = shelf_height = 0
+
+        for key in sorted(sizes, key=lambda k: sizes[k][1], reverse=True):
+            width, height = sizes[key]
+            if width + padding > self.max_size or height + padding > self.max_size:
+                continue
+
+            if len(pages) == 0 or x + width + padding > self.max_size:
+                # Start a new shelf above the last one.
+                x = 0
+                y += shelf_height
+                shelf_height = 0
+            if len(pages) == 0 or y + height + padding > self.max_size:
+                pages.append([0, 0])
+                x = y = shelf_height = 0
+
+            placements[key] = [len(pages) - 1, x, y]
+            page = pages[-1]
+            page[0] = max(page[0], x + width)
+            page[1] = max(page[1], y + height)
+            x += width + padding
+            shelf_height = max(shelf_height, height + padding)
+
+        return placements, pages
+
+    def build(self, paths, resolve_path):
+        """
+        Read the PNG files, pack them and create the textures of the pages.
+        resolve_path turns a path into the key regions are stored with.
+        """
+        images = {}
+        for path in paths:
+            images[resolve_path(path)] = read_texture_pixels(path)
+
+        sizes = dict((key, [image[0], image[1]]) for key, image in images.items())
+        placements, page_sizes = self.pack(sizes)
+
+        pixels = [numpy.zeros((height, width, 4), dtype=numpy.uint8)
+                  for width, height in page_sizes]
+        for key, (page, x, y) in placements.items():
+            width, height = sizes[key]
+            # Pixels are 8 bit RGBA, rows from bottom to top.
+            pixels[page][y:y + height, x:x + width] = images[key][2]
+            self.regions[key] = [page, x, y, width, height]
+
+        for index, (width, height) in enumerate(page_sizes):
+            self.pages.append(create_texture(width, height, pixels[index]))
+            self.page_sizes.append([width, height])
+
+    def uv_rect(self, key):
+        """
+        Return the rectangle of a packed texture in texture coordinates
+        [u1, v1, u2, v2] of its page.
+        """
+        page, x, y, width, height = self.regions[key]
+        page_width, page_height = self.page_sizes[page]
+        return [x / page_width, y / page_height,
+                (x + width) / page_width, (y + height) / page_height]
+
+
+class SpatialGrid:
+    """
+    A uniform grid over the bounds of the morphs of a World, used to find
+    which morphs are under the mouse without going through all of them.
+    Each morph is stored in every cell its bounds overlap, so a point query
+    only has to look at a single cell. Morphs covering too many cells, like
+    big background panels, are kept in a separate list that every query
+    checks, so moving them does not have to update hundreds of cells.
+    Bounds are in World coordinates, see Morph.get_absolute_position.
+    """
+
+    def __init__(self, cell_size=64, max_cells=64):
+        # The width and height of each cell in pixels.
+        self.cell_size = cell_size
+
+        # Morphs overlapping more cells than this go to the large list.
+        self.max_cells = max_cells
+
+        # Maps (column, row) to the set of morphs overlapping that cell.
+        self.cells = {}
+
+        # Morphs too large to be stored in cells.
+        self.large = set()
+
+        # Maps each morph to the range of cells it overlaps, so it can be
+        # removed or moved without searching for it.
+        self.ranges = {}
+
+    def cell_range(self, bounds):
+        """
+        Return the first and last column and row overlapped by the given
+        bounds [x1, y1, x2, y2].
+        """
+        size = self.cell_size
+        return (int(math.floor(bounds[0] / size)), int(math.floor(bounds[1] / size)),
+                int(math.floor(bounds[2] / size)), int(math.floor(bounds[3] / size)))
+
+    def insert(self, item, bounds):
+        """
+        Add an item with the given bounds, or move it if it is already in the grid.
+        """
+        cell_range = self.cell_range(bounds)
+        old_range = self.ranges.get(item)
+        if old_range == cell_range:
+            return
+        if old_range is not None:
+            self.unlink(item, old_range)
+
+        self.ranges[item] = cell_range
+        if self.is_large(cell_range):
+            self.large.add(item)
+            return
+        cells = self.cells
+        for column in range(cell_range[0], cell_range[2] + 1):
+            for row in range(cell_range[1], cell_range[3] + 1):
+                cell = cells.get((column, row))
+                if cell is None:
+                    cells[(column, row)] = {item}
+                else:
+                    cell.add(item)
+
+    def remove(self, item):
+        """
+        Remove an item from the grid, if it is there.
+        """
+        old_range = self.ranges.pop(item, None)
+        if old_range is not None:
+            self.unlink(item, old_range)
+
+    def is_large(self, cell_range):
+        return ((cell_range[2] - cell_range[0] + 1) *
+                (cell_range[3] - cell_range[1] + 1)) > self.max_cells
+
+    def unlink(self, item, cell_range):
+        """
+        Internal, remove the item from the cells in the given range.
+        """
+        if self.is_large(cell_range):
+            self.large.discard(item)
+            return
+        cells = self.cells
+        for column in range(cell_range[0], cell_range[2] + 1):
+            for row in range(cell_range[1], cell_range[3] + 1):
+                cell = cells.get((column, row))
+                if cell is not None:
+                    cell.discard(item)
+                    if len(cell) == 0:
+                        del cells[(column, row)]
+
+    def query_point(self, x, y):
+        """
+        Return the items whose cells contain the point. These are only
+        candidates, their exact shape still has to be checked.
+        """
+        size = self.cell_size
+        found = set(self.large)
+        cell = self.cells.get((int(math.floor(x / size)), int(math.floor(y / size))))
+        if cell is not None:
+            found.update(cell)
+        return found
+
+    def query_rect(self, bounds):
+        """
+        Return the items whose cells overlap the given bounds [x1, y1, x2, y2].
+        Like query_point, these are only candidates.
+        """
+        cell_range = self.cell_range(bounds)
+        found = set(self.large)
+        if self.is_large(cell_range):
+            # Cheaper to look at the occupied cells than at every cell in range.
+            for (column, row), cell in self.cells.items():
+                if (cell_range[0] <= column <= cell_range[2] and
+                        cell_range[1] <= row <= cell_range[3]):
+                    found.update(cell)
+            return found
+        cells = self.cells
+        for column in range(cell_range[0], cell_range[2] + 1):
+            for row in range(cell_range[1], cell_range[3] + 1):
+                cell = cells.get((column, row))
+                if cell is not None:
+                    found.update(cell)
+        return found
+
+
+class TextureCache:
+    """
+    The TextureCache makes sure each PNG file is loaded only once, no matter
+    how many morphs use it. Textures are shared by their resolved file path
+    and counted, every morph using a texture holds a reference to it.
+    When no morph uses a texture anymore it is not freed right away, it is
+    kept in case it is needed again, until the textures kept this way go over
+    the memory budget. Then the least recently used ones are freed first.
+    All morphs share the same cache, see Morph.texture_cache.
+    Textures are GPUTextures created straight from the decoded PNG files,
+    they never become Blender images, so they don't show up in the image
+    editor and don't need to be loaded to the GPU again every draw.
+    If asynchronous is True, PNG files are decoded by PyPNG in background
+    threads instead, and the World uploads the decoded textures a few at a
+    time while drawing. Until then morphs are drawn with their color.
+    """
+
+    def __init__(self, memory_budget=128 * 1024 * 1024, asynchronous=False,
+                 upload_budget=4 * 1024 * 1024, workers=2):
+        # How many bytes of textures not used by any morph can be kept.
+        # Textures still in use are never freed, even above the budget.
+        self.memory_budget = memory_budget
+
+        # Decode textures in background threads, needs PyPNG.
+        self.asynchronous = asynchronous
+
+        # How many bytes of decoded textures can be uploaded per frame.
+        # At least one texture is uploaded per frame no matter its size.
+        self.upload_budget = upload_budget
+
+        # The number of threads decoding textures, and the threads themselves
+        # which are only created when first needed.
+        self.workers = workers
+        self.executor = None
+
+        # The entries whose texture is still being decoded, in the order
+        # they were requested.
+        self.pending = OrderedDict()
+
+        # Maps the resolved path of each loaded texture to its entry. An entry
+        # is a dictionary with the GPUTexture (None until it's loaded), its
+        # dimensions, its size in bytes,
+        # the number of references to it and the rectangle of the image it
+        # uses in texture coordinates, which is the whole image unless the
+        # texture is part of an atlas. Entries of textures packed in an atlas
+        # (and of atlas pages) also have the atlas and are never freed.
+        self.entries = {}
+
+        # The texture atlases built with build_atlas.
+        self.atlases = []
+
+        # The entries no morph uses at the moment, least recently used first.
+        self.unused = OrderedDict()
+
+        # Statistics, see stats().
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes_resident = 0
+
+    def resolve_path(self, full_path):
+        """
+        Return the path used as the key of a texture, so that different ways of
+        writing the same path share the texture.
+        """
+        return os.path.normcase(os.path.abspath(bpy.path.abspath(full_path)))
+
+    def acquire(self, full_path):
+        """
+        Return the entry of the texture at the given path, loading it if it is
+        not in the cache, and add a reference to it. Every acquire must be
+        matched with a release when the texture is not needed anymore.
+        """
+        key = self.resolve_path(full_path)
+        entry = self.entries.get(key)
+
+        if entry is not None:
+            self.hits += 1
+            if entry['references'] == 0 and entry['atlas'] is None:
+                del self.unused[key]
+        else:
+            self.misses += 1
+            entry = {
+                'key': key, 'texture': None, 'dimensions': [0, 0], 'bytes': 0,
+                'references': 0, 'uv_rect': [0.0, 0.0, 1.0, 1.0], 'atlas': None}
+            self.entries[key] = entry
+
+            if self.asynchronous and png is not None:
+                if self.executor is None:
+                    self.executor = ThreadPoolExecutor(self.workers)
+                entry['future'] = self.executor.submit(decode_png, full_path)
+                self.pending[key] = entry
+            else:
+                self.set_texture(entry, *read_texture_pixels(full_path))
+
+        entry['references'] += 1
+        return entry
+
+    def set_texture(self, entry, width, height, pixels):
+        """
+        Internal, create the texture of an entry from its decoded pixels.
+        """
+        entry['texture'] = create_texture(width, height, pixels)
+        # Keep the same list, morphs share it through their textures.
+        entry['dimensions'][:] = [width, height]
+        # 8 bit RGBA once uploaded to the GPU.
+        entry['bytes'] = width * height * 4
+        self.bytes_resident += entry['bytes']
+
+    def process_uploads(self):
+        """
+        Create the textures that have finished decoding, until
+        upload_budget bytes have been uploaded. Must be called from Blender's
+        main thread, World.draw does it every frame. Returns the number of
+        textures still being decoded or waiting for upload.
+        """
+        uploaded = 0
+        for key, entry in list(self.pending.items()):
+            if uploaded >= self.upload_budget:
+                break
+            future = entry['future']
+            if not future.done():
+                continue
+            del self.pending[key]
+            del entry['future']
+
+            try:
+                width, height, pixels = future.result()
+            except Exception:
+                # PyPNG could not read it, let Blender try.
+                width, height, pixels = read_image_pixels(key)
+            self.set_texture(entry, width, height, pixels)
+            uploaded += entry['bytes']
+
+        return len(self.pending)
+
+    def build_atlas(self, texture_path, max_size=2048, padding=1):
+        """
+        Pack all the PNG files in texture_path (usually Morph.texture_path)
+        into a TextureAtlas. From then on, morphs loading any of these files get
+        its region of the atlas instead of a texture of their own. Morphs that
+        have already loaded them keep their textures until they load them again.
+        """
+        paths = [os.path.join(texture_path, file_name)
+                 for file_name in sorted(os.listdir(texture_path))
+                 if file_name.lower().endswith('.png')]
+        atlas = TextureAtlas(max_size, padding)
+        atlas.build(paths, self.resolve_path)
+
+        for index, texture in enumerate(atlas.pages):
+            width, height = atlas.page_sizes[index]
+            page_key = "%s#atlas%d.%d" % (self.resolve_path(texture_path), len(self.atlases), index)
+            # The atlas holds a reference to its pages, so they stay loaded.
+            page = {
+                'key': page_key, 'texture': texture, 'dimensions': [width, height],
+                'bytes': width * height * 4, 'references': 1,
+                'uv_rect': [0.0, 0.0, 1.0, 1.0], 'atlas': atlas}
+            self.entries[page_key] = page
+            self.bytes_resident += page['bytes']
+
+        for key, region in atlas.regions.items():
+            old_entry = self.entries.get(key)
+            if old_entry is not None:
+                if old_entry['references'] == 0:
+                    # Unused regions of an earlier atlas own no texture and
+                    # are never in unused, they are simply replaced.
+                    if old_entry['atlas'] is None:
+                        self.unused.pop(key, None)
+                        self.free(old_entry)
+                else:
+                    # Still in use, keep it under another key until released.
+                    del self.entries[key]
+                    old_entry['key'] = "%s#replaced%d" % (key, id(old_entry))
+                    self.entries[old_entry['key']] = old_entry
+            # Regions use the texture of their page and cost no memory of their own.
+            self.entries[key] = {
+                'key': key, 'texture': atlas.pages[region[0]],
+                'dimensions': [region[3], region[4]], 'bytes': 0,
+                'references': 0, 'uv_rect': atlas.uv_rect(key), 'atlas': atlas}
+
+        self.atlases.append(atlas)
+        return atlas
+
+    def release(self, entry):
+        """
+        Remove a reference to a texture entry returned by acquire.
+        """
+        entry['references'] -= 1
+        if entry['references'] == 0 and entry['atlas'] is None:
+            self.unused[entry['key']] = entry
+            self.evict()
+
+    def evict(self):
+        """
+        Free unused textures, least recently used first, until the cache is
+        within its memory budget.
+        """
+        while self.bytes_resident > self.memory_budget and len(self.unused) > 0:
+            key, entry = self.unused.popitem(last=False)
+            self.free(entry)
+            self.evictions += 1
+
+    def clear(self):
+        """
+        Free all the textures no morph uses at the moment.
+        """
+        while len(self.unused) > 0:
+            key, entry = self.unused.popitem(last=False)
+            self.free(entry)
+
+    def free_all(self):
+        """
+        Stop decoding textures in the background and free all the textures no
+        morph uses. The cache is shared by all Worlds, so call it when the
+        add-on is unregistered, after deleting its Worlds. Textures still
+        decoding are forgotten and decoded again if they are loaded again, the
+        threads are created again if needed.
+        """
+        for key, entry in list(self.pending.items()):
+            self.unused.pop(key, None)
+            self.free(entry)
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+        self.clear()
+
+    def free(self, entry):
+        """
+        Internal, free the texture of an entry and remove it from the cache.
+        """
+        del self.entries[entry['key']]
+        self.bytes_resident -= entry['bytes']
+        if self.pending.pop(entry['key'], None) is not None:
+            entry.pop('future').cancel()
+        # The GPU memory is freed once nothing refers to the texture.
+        entry['texture'] = None
+
+    def stats(self):
+        """
+        Return a dictionary with the number of hits and misses, the number of
+        textures loaded and evicted and the bytes of texture memory in use.
+        """
+        return {
+            'hits': self.hits, 'misses': self.misses,
+            'evictions': self.evictions, 'textures': len(self.entries),
+            'unused_textures': len(self.unused),
+            'bytes_resident': self.bytes_resident,
+            'memory_budget': self.memory_budget,
+            'pending': len(self.pending)}
+
+
+def decode_png(path):
+    """
+    Decode a PNG file with PyPNG and return its width, height and pixels as
+    a (height, width, 4) array of 8 bit RGBA with rows from bottom to top, the
+    order textures expect. Runs in the background threads of the TextureCache.
+    """
+    width, height, rows, info = png.Reader(filename=path).asRGBA8()
+    pixels = numpy.vstack([numpy.frombuffer(row, dtype=numpy.uint8) for row in rows])
+    return width, height, numpy.ascontiguousarray(pixels.reshape(height, width, 4)[::-1])
+
+
+def read_image_pixels(path):
+    """
+    Read the pixels of an image file through Blender, for when PyPNG is not
+    available or can't read the file. The image is removed right after, so
+    it never stays in the blend file. Returns the same as decode_png.
+    """
+    image = bpy.data.images.load(path)
+    try:
+        width, height = image.size[0], image.size[1]
+        pixels = numpy.empty(width * height * 4, dtype=numpy.float32)
+        image.pixels.foreach_get(pixels)
+    finally:
+        bpy.data.images.remove(image)
+    pixels = numpy.clip(pixels * 255.0 + 0.5, 0.0, 255.0).astype(numpy.uint8)
+    return width, height, pixels.reshape(height, width, 4)
+
+
+def read_texture_pixels(path):
+    """
+    Return the width, height and 8 bit RGBA pixels of a PNG file, with PyPNG
+    if possible.
+    """
+    if png is not None:
+        return decode_png(path)
+    return read_image_pixels(path)
+
+
+def create_texture(width, height, pixels, format='RGBA8'):
+    """
+    Create a GPUTexture from a NumPy array of RGBA pixels, 8 bit for images or
+    floats with format 'RGBA32F', for data rather than images.
+    """
+    # GPUTexture only takes FLOAT Buffers, 8 bit pixels go between 0 and 1.
+    if pixels.dtype == numpy.uint8:
+        pixels = pixels.astype(numpy.float32) / 255.0
+    else:
+        pixels = pixels.astype(numpy.float32, copy=False)
+    pixels = numpy.ascontiguousarray(pixels).ravel()
+    data = gpu.types.Buffer('FLOAT', len(pixels))
+    try:
+        # Copy the pixels straight into the memory of the Buffer, instead of
+        # going through them one by one as a sequence.
+        numpy.frombuffer(data, dtype=numpy.float32)[:] = pixels
+    except (TypeError, ValueError):
+        # This version of Blender has Buffers without the buffer protocol.
+        data = gpu.types.Buffer('FLOAT', len(pixels), pixels)
+    return gpu.types.GPUTexture((width, height), format=format, data=data)
+
+
+class RenderCache:
+    """
+    The image a morph with cache_rendering enabled has rendered itself and
+    its children into, so they can be drawn as a single textured rectangle
+    until something inside changes.
+    """
+
+    def __init__(self):
+        # The GPUOffScreen holding the image, created on first use and
+        # created again when the size of the morph changes.
+        self.offscreen = None
+        self.width = 0
+        self.height = 0
+
+        # True when the image is outdated and has to be rendered again.
+        self.dirty = True
+
+        # How many times the image has been rendered. Useful to make sure it
+        # is not rendered more often than needed.
+        self.render_count = 0
+
+    def free(self):
+        """
+        Free the GPUOffScreen.
+        """
+        if self.offscreen is not None:
+            self.offscreen.free()
+            self.offscreen = None
+        self.dirty = True
+
+
+class MorphStyle:
+    """
+    The look of a morph: its color, corners, whether it's a circle and the
+    folder of its textures. Most morphs of a GUI look like their siblings, so
+    instead of each morph keeping its own copy, morphs that look the same
+    share one MorphStyle. Styles never change, get one with MorphStyle.get()
+    or from another style with replace(), both return the existing style if
+    there is one with the same values.
+    """
+
+    __slots__ = ('color', 'round_corners', 'round_corners_strength',
+                 'round_corners_select', 'circle', 'texture_path', '__weakref__')
+
+    # All styles in use, by their values. Styles no morph uses go away.
+    styles = weakref.WeakValueDictionary()
+
+    @classmethod
+    def get(cls, color=(1.0, 1.0, 1.0, 1.0), round_corners=False, round_corners_strength=10,
+            round_corners_select=(True, True, True, True), circle=False,
+            texture_path="media/graphics/"):
+        """
+        Return the style with the given values. color and round_corners_select
+        can be any sequence, they are kept as tuples.
+        """
+        key = (tuple(color), round_corners, round_corners_strength,
+               tuple(round_corners_select), circle, texture_path)
+        style = cls.styles.get(key)
+        if style is None:
+            style = cls.__new__(cls)
+            (style.color, style.round_corners, style.round_corners_strength,
+             style.round_corners_select, style.circle, style.texture_path) = key
+            cls.styles[key] = style
+        return style
+
+    def replace(self, **values):
+        """
+        Return the style with the values of this one, except those given.
+        """
+        for name in self.__slots__[:-1]:
+            values.setdefault(name, getattr(self, name))
+        return MorphStyle.get(**values)
+
+
+def action_property(event_name):
+    """
+    Return a property for the action of a Morph handling event_name, like
+    on_left_click. Most morphs have no actions at all, so they are kept in a
+    dict per morph only when there is at least one.
+    """
+    def get_action(self):
+        actions = self._actions
+        if actions is None:
+            return None
+        return actions.get(event_name)
+
+    def set_action(self, action):
+        actions = self._actions
+        if action is None:
+            if actions is not None:
+                actions.pop(event_name, None)
+                if len(actions) == 0:
+                    self._actions = None
+        else:
+            if actions is None:
+                actions = self._actions = {}
+            actions[event_name] = action
+
+    return property(get_action, set_action,
+                    doc="The action whose %s method is called, or None." % event_name)
 
 
 class Morph:
@@ -73,9 +1544,52 @@ class Morph:
     """
 
     # Global variable for the definition of the default folder where
-    # the PNG files which are used as textures are located.
+    # the PNG files which are used as textures are located. Each morph keeps
+    # the folder it was created with in its style.
     texture_path = "media/graphics/"
 
+    # Morphs don't have a __dict__, there can be many thousands of them and
+    # a dict per morph would take most of their memory. Subclasses that don't
+    # define __slots__ get a __dict__ as usual.
+    __slots__ = (
+        'real_width', 'real_height', 'real_position', '_width', '_height', '_position',
+        '_style', 'handles_mouse_down', 'handles_events', 'handles_mouse_over',
+        'handles_drag_drop', '_is_hidden', '_effective_hidden', '_visibility_generation',
+        '_parent', 'children', '_world', '_name', 'draw_count', 'textures',
+        '_transform_dirty', '_absolute_scale', '_absolute_offset', '_bounds_dirty',
+        '_local_bounds', '_parent_bounds', '_geometry_dirty', '_outline', '_tex_coords',
+        '_scale', '_drag_drop', 'drag_position', 'active_texture', '_actions',
+        '_render_cache')
+
+    # These are actions which are basically simple python objects
+    # that contain an appropriate method like on_left_click or on_right_click.
+    # This allows us to keep as MVC model that has the handling of
+    # events seperate from Morpheas and for the user to define his
+    # own actions without having to subclass Morph.
+    on_left_click_action = action_property('on_left_click')
+    on_left_click_released_action = action_property('on_left_click_released')
+    on_right_click_action = action_property('on_right_click')
+    on_right_click_released_action = action_property('on_right_click_released')
+    on_mouse_in_action = action_property('on_mouse_in')
+    on_mouse_out_action = action_property('on_mouse_out')
+
+    # The cache all morphs load their textures through, so morphs using the
+    # same PNG file share a single image.
+    texture_cache = TextureCache()
+
+    # Morphs that clip their children, like ScrollMorph, set this. Their
+    # children are left out of the spatial index of the World, they find
+    # them themselves, see get_content_candidates().
+    clips_children = False
+
+    # How far the children are moved from where their position puts them,
+    # in World units. Only morphs that scroll their children change it.
+    _content_offset = (0, 0)
+
+    # The children whose transform was computed since the children were
+    # last scrolled, a set for morphs that scroll them, see ScrollMorph.
+    _placed_children = None
+
     def __init__(
             self, texture=None, width=100, height=100, position=[0, 0],
             color=[1.0, 1.0, 1.0, 1.0], name='noname',
@@ -98,15 +1612,26 @@ class Morph:
 
         self._width = self.real_width * scale
         self._height = self.real_height * scale
-        self._position = [
-            self.real_position[0],
-            self.real_position[1]]
+        self._position = (self.real_position[0], self.real_position[1])
 
-        # If no texture is defined, then this is the color of the morph.
+        # The color, corners, circle flag and texture folder of the morph,
+        # shared with the morphs that look the same, see MorphStyle and the
+        # properties of the same names.
+        # If no texture is defined, then color is the color of the morph.
         # Else, this affects the color and transparency of the texture.
-        # Color is a list of floats following the RGBA: red, green, blue
-        # and alpha (transparency). [ r , g , b, alpha ]
-        self.color = color
+        # Color is a tuple of floats following the RGBA: red, green, blue
+        # and alpha (transparency). ( r , g , b, alpha )
+        # round_corners is to be used only if no texture is given. The drawn
+        # rectangle will have round edges. round_corners_strength defines how much
+        # should the corners be rounded, higher values give more rounded results.
+        # round_corners_select defines which corners to round if round_corners is
+        # true. The order is (lower_left, upper_left, upper_right, lower_right).
+        # Default behaviour is to round all of them.
+        if texture_path is None:
+            texture_path = Morph.texture_path
+        self._style = MorphStyle.get(
+            color, round_corners, round_corners_strength, round_corners_select,
+            circle, texture_path)
 
         # Essentially these variables enable and disable the handling of specific events.
         # If events are disabled they are ignored by this morph but they do
@@ -118,7 +1643,12 @@ class Morph:
         self.handles_mouse_over = False
         self.handles_drag_drop = drag_drop
 
+        # Whether the morph itself is hidden. Whether it's visible also depends on
+        # its parents, see the is_hidden property, which caches the answer for
+        # the visibility generation of the World it was computed for.
         self._is_hidden = False
+        self._effective_hidden = False
+        self._visibility_generation = -1
 
         # A morph can be inside another morph.
         # That other morph is the parent while this morph becomes the child.
@@ -130,11 +1660,6 @@ class Morph:
         # where the mouse is and what region draws at the time.
         self._world = None
 
-        # These is are the positions of the 4 corners of the boundaries of the morph.
-        self.bounds = [
-            self.position[0], self.position[1], self.position[0] + self.width,
-            self.position[1] + self.height]
-
         # A name is an optional feature for when you want to locate a specific morph inside a world
         # and do something to or with it.
         self._name = name
@@ -146,32 +1671,38 @@ class Morph:
         # Though only one texture can display at time, a morph can have multiple textures.
         self.textures = {}
 
+        # Absolute scale and absolute position are cached because they are
+        # needed several times per morph on every draw and event. The cache is
+        # invalidated for the whole subtree when position or scale change,
+        # see invalidate_transform() and update_transform().
+        self._transform_dirty = True
+        self._absolute_scale = scale
+        self._absolute_offset = (0, 0)
+
+        # The bounds [x1, y1, x2, y2] of the morph and all its visible children,
+        # relative to the lower left corner of the morph, and the part they
+        # were last found to take in the bounds of the parent. They are kept up
+        # to date as morphs change, see update_bounds() and the bounds property.
+        self._bounds_dirty = True
+        self._local_bounds = None
+        self._parent_bounds = None
+
+        # The shape of the morph in local coordinates and for textured morphs
+        # the texture coordinates of its points. They are built by
+        # build_geometry() and kept until something changes the shape.
+        self._geometry_dirty = True
+        self._outline = None
+        self._tex_coords = None
+
+        # The RenderCache of the morph if cache_rendering is enabled, else None.
+        self._render_cache = None
+
         # A morph can be scaled like any blender object.
         self.scale = scale
 
-        # To be used only if no texture is given. The drawn rectangle will have round edges.
-        self.round_corners = round_corners
-
-        # Defines how much should the corners be rounded. Higher values give more rounded results.
-        # Only used if round_corners is True and no texture is given.
-        self.round_corners_strength = round_corners_strength
-
-        # Defines which corners to round if round_corners is true. The order is
-        # [lower_left, upper_left, upper_right, lower_right]. Default behaviour is
-        # to round all of them.
-        self.round_corners_select = round_corners_select
-
-        self.circle = circle
-
-        # This is the path to the textures.
-        if texture_path is None:
-            self.texture_path = Morph.texture_path
-        else:
-            self.texture_path = texture_path
-
         # Drag and drop flag.
-        self.drag_drop = False
-        self.drag_position = [0, 0]
+        self._drag_drop = False
+        self.drag_position = (0, 0)
 
         # Active texture is the texture displaying at the time.
         # Only one texture can display at a time for each morph,
@@ -179,14 +1710,9 @@ class Morph:
         # Each child will have its own active texture.
         self.active_texture = texture
 
-        # Not to be used by anyone but this class.
-        self.image = None
-
-        # These are actions which are basically simple python objects
-        # that contain an appropriate method like on_left_click or on_right_click.
-        # This allows us to keep as MVC model that has the handling of
-        # events seperate from Morpheas and for the user to define his
-        # own actions without having to subclass Morph.
+        # The actions of the morph by event name, None while it has none.
+        # See the on_..._action properties.
+        self._actions = None
         self.on_left_click_action = on_left_click_action
         self.on_left_click_released_action = on_left_click_released_action
         self.on_right_click_action = on_right_click_action
@@ -233,6 +1759,8 @@ class Morph:
         """
         Return the scaled width of the morph.
         """
+        if self._transform_dirty:
+            self.update_transform()
         if self._width < 0:
             raise ValueError("width must not be a negative value")
         else:
@@ -248,6 +1776,10 @@ class Morph:
         else:
             self.real_width = value
             self._width = value * self.get_absolute_scale()
+            self.invalidate_geometry()
+            self.update_bounds(True)
+            if self._world is not None:
+                self._world._index_dirty.add(self)
 
     @property
     def height(self):
@@ -264,6 +1796,8 @@ class Morph:
         """
         Return the scaled height of the morph.
         """
+        if self._transform_dirty:
+            self.update_transform()
         if self._height < 0:
             raise ValueError("height must not be a negative value ")
         else:
@@ -279,6 +1813,10 @@ class Morph:
         else:
             self.real_height = value
             self._height = value * self.get_absolute_scale()
+            self.invalidate_geometry()
+            self.update_bounds(True)
+            if self._world is not None:
+                self._world._index_dirty.add(self)
 
     @property
     def position(self):
@@ -292,8 +1830,9 @@ class Morph:
         """
         Return the scaled position of the morph.
         """
-        return [self.real_position[0] * self.get_absolute_scale(),
-                self.real_position[1] * self.get_absolute_scale()]
+        scale = self.get_absolute_scale()
+        return [self.real_position[0] * scale,
+                self.real_position[1] * scale]
 
     @position.setter
     def position(self, value):
@@ -301,8 +1840,10 @@ class Morph:
         Change the position of the morph.
         """
         self.real_position = value
-        self._position = [value[0] * self.get_absolute_scale(),
-                          value[1] * self.get_absolute_scale()]
+        self.invalidate_transform()
+        self.update_bounds()
+        if self._parent is not None:
+            self._parent.invalidate_render_cache()
 
     @property
     def world_position(self):
@@ -342,31 +1883,39 @@ class Morph:
         """
         Return true if mouse is over morph.
         """
-        # If morph is a circle, conventional bounds don't work, need to
-        # get the distance of the cursor position from the center of the
-        # circle morph and compare it with its radius.
-        if self.circle:
-            ex = self.world.mouse_position_absolute[0]
-            ey = self.world.mouse_position_absolute[1]
-
-            position_x = self.get_absolute_position()[0]
-            position_y = self.get_absolute_position()[1]
-
-            circleR = float(self._width / 2)
-            circleCenter = [position_x +
-                            circleR, position_y + circleR]
-            result = morpheas_tools.pointsDistance(
-                circleCenter[0], circleCenter[1], ex, ey) <= circleR
-            return result
-
-        apx1 = self.get_absolute_position()[0]
-        apy1 = self.get_absolute_position()[1]
-        apx2 = self.get_absolute_position()[0] + self.width
-        apy2 = self.get_absolute_position()[1] + self.height
+        # Round corners and circles are tested with the signed distance to
+        # their edge, the same shape the shape shader draws.
+        position_x, position_y = self.get_absolute_position()
         ex = self.world.mouse_position_absolute[0]
         ey = self.world.mouse_position_absolute[1]
-        result = (ex > apx1 and ex < apx2 and ey > apy1 and ey < apy2)
-        return result
+        width, height = self.shape_size()
+        return morpheas_tools.shapeDistance(
+            ex - position_x, ey - position_y, width, height, self.shape_radii()) <= 0
+
+    def shape_size(self):
+        """
+        Return the scaled width and height of the shape of the morph. A circle
+        is as tall as it is wide.
+        """
+        if self._transform_dirty:
+            self.update_transform()
+        if self.circle:
+            return self._width, self._width
+        return self._width, self._height
+
+    def shape_radii(self):
+        """
+        Return the radii of the corners of the shape of the morph in the order
+        [lower_left, upper_left, upper_right, lower_right]. Like when drawing,
+        round corners are only used by morphs without a texture.
+        """
+        if self.circle:
+            radius = self._width / 2.0
+            return [radius, radius, radius, radius]
+        if self.round_corners and len(self.textures) == 0:
+            strength = self.round_corners_strength
+            return [strength if selected else 0.0 for selected in self.round_corners_select]
+        return [0.0, 0.0, 0.0, 0.0]
 
     # this is an internal method not to be used directly by the user
     # it loads the texture, the actual displaying is handled by the
@@ -386,16 +1935,20 @@ class Morph:
             It allows to scale the texture, 1.0 being the full size.
         """
 
-        # Create the full path of the texture to be loaded and load it.
-        full_path = self.texture_path + name
-        self.image = bpy.data.images.load(full_path)
+        # Create the full path of the texture to be loaded and load it,
+        # or get it from the cache if another morph already did.
+        full_path = self._style.texture_path + name
+        entry = self.texture_cache.acquire(full_path)
+        if name in self.textures:
+            self.texture_cache.release(self.textures[name]['cache_entry'])
 
         # A Morph can have multiple textures if it is needed, the information
         # about those textures are fetched directly from the PNG file.
+        # The texture itself is in the cache entry, it may still be loading.
         self.textures[name] = {
-            'dimensions': [self.image.size[0], self.image.size[1]],
-            'full_path': full_path, 'image': self.image,
-            'is_gl_initialised': False, 'scale': scale, 'texture_id': 0}
+            'dimensions': entry['dimensions'],
+            'full_path': full_path, 'scale': scale,
+            'cache_entry': entry}
 
         self.activate_texture(name)
 
@@ -407,138 +1960,418 @@ class Morph:
         """
         self.active_texture = name
         self.scale = self.textures[name]['scale']
+        self.invalidate_geometry()
 
     def draw(self, context):
         """
         The main draw function. Kind of a nightmare to figure out...
+        The shape of the morph is built once in local coordinates and cached,
+        so drawing only has to move it to the position of the morph.
+        Hidden morphs and morphs outside the area the World draws are skipped
+        together with their children.
+        """
+        if self._is_hidden or self.is_culled():
+            return
+
+        if self._render_cache is not None:
+            self.draw_cached(context)
+            return
+
+        world = self.world
+        origin = world.get_absolute_position()
+        self.draw_shape(world.renderer,
+                        origin[0] - world.draw_area_position[0],
+                        origin[1] - world.draw_area_position[1])
+
+        # Also draw all its children.
+        self.draw_children(context)
+
+    def draw_children(self, context):
+        """
+        Draw the children of the morph, called by draw() after the morph
+        itself. Classes that draw their children their own way override it,
+        the World then leaves the children to them.
+        """
+        for child_morph in self.children:
+            child_morph.draw(context)
+
+    def draw_clipped_children(self, context, children):
+        """
+        Internal, draw children clipped to the shape of the morph, for morphs
+        that clip their children. Morphs outside it are culled as well.
+        """
+        world = self.world
+        renderer = world.renderer
+        state = world.gpu_state
+        x, y = self._absolute_offset
+        width, height = self.shape_size()
+        origin = world.get_absolute_position()
+        region_x = origin[0] - world.draw_area_position[0] + x
+        region_y = origin[1] - world.draw_area_position[1] + y
+
+        # What is waiting was added before clipping.
+        renderer.flush()
+        state.push_scissor(region_x, region_y, region_x + width, region_y + height)
+
+        cull_bounds = world.cull_bounds
+        window = [x, y, x + width, y + height]
+        if cull_bounds is not None:
+            window = [max(window[0], cull_bounds[0]), max(window[1], cull_bounds[1]),
+                      min(window[2], cull_bounds[2]), min(window[3], cull_bounds[3])]
+        world.cull_bounds = window
+        for child in children:
+            child.draw(context)
+        world.cull_bounds = cull_bounds
+
+        renderer.flush()
+        state.pop_scissor()
+
+    def get_clipped_candidates(self, children, x, y):
+        """
+        Internal, return the visible morphs handling events among children
+        and their children whose bounds contain the point (x, y) of the
+        World, for the get_content_candidates() of morphs that clip their
+        children. The point must be inside the morph.
+        """
+        stack = list(children)
+        candidates = []
+        while len(stack) > 0:
+            morph = stack.pop()
+            if morph._is_hidden:
+                continue
+            bounds = morph.get_subtree_bounds()
+            if not (bounds[0] <= x <= bounds[2] and bounds[1] <= y <= bounds[3]):
+                continue
+            if morph.handles_events:
+                candidates.append(morph)
+            if morph.clips_children:
+                candidates.extend(morph.get_content_candidates(x, y))
+            else:
+                stack.extend(morph.children)
+        return candidates
+
+    def draw_cached(self, context):
+        """
+        Draw the morph and its children as the image they were rendered into,
+        rendering them first if it's outdated. See cache_rendering.
+        """
+        world = self.world
+        renderer = world.renderer
+        cache = self._render_cache
+
+        # The image covers the bounds of the morph and its children.
+        origin = world.get_absolute_position()
+        origin_x = origin[0] - world.draw_area_position[0]
+        origin_y = origin[1] - world.draw_area_position[1]
+        # It goes on whole pixels, so its pixels are the pixels of the region
+        # and drawing it doesn't blur it.
+        local = self.get_local_bounds()
+        left = origin_x + self._absolute_offset[0] + local[0]
+        bottom = origin_y + self._absolute_offset[1] + local[1]
+        x = int(math.floor(left))
+        y = int(math.floor(bottom))
+        width = int(math.ceil(left + local[2] - local[0])) - x
+        height = int(math.ceil(bottom + local[3] - local[1])) - y
+        if width <= 0 or height <= 0:
+            return
+
+        if cache.dirty or cache.width != width or cache.height != height:
+            if cache.offscreen is None or cache.width != width or cache.height != height:
+                cache.free()
+                cache.offscreen = gpu.types.GPUOffScreen(width, height)
+                cache.width = width
+                cache.height = height
+
+            # Draw what is waiting first, it belongs on the region.
+            renderer.flush()
+
+            # Everything inside is drawn as usual, with the region moved so
+            # the lower left corner of the bounds is the corner of the image.
+            cull_bounds = world.cull_bounds
+            world.cull_bounds = None
+
+            # Clipping is in region coordinates, the image has its own.
+            state = world.gpu_state
+            scissors = state.scissors
+            scissor_origin = state.scissor_origin
+            state.scissors = []
+            state.scissor_origin = (x, y)
+            if len(scissors) > 0:
+                state.apply_scissor()
+
+            with cache.offscreen.bind():
+                bgl.glClearColor(0.0, 0.0, 0.0, 0.0)
+                bgl.glClear(bgl.GL_COLOR_BUFFER_BIT)
+                with gpu.matrix.push_pop(), gpu.matrix.push_pop_projection():
+                    gpu.matrix.load_projection_matrix(Matrix((
+                        (2.0 / width, 0.0, 0.0, -1.0),
+                        (0.0, 2.0 / height, 0.0, -1.0),
+                        (0.0, 0.0, 1.0, 0.0),
+                        (0.0, 0.0, 0.0, 1.0))))
+                    gpu.matrix.load_identity()
+                    gpu.matrix.translate((-x, -y))
+                    self.draw_shape(renderer, origin_x, origin_y)
+                    self.draw_children(context)
+                    renderer.flush()
+            world.cull_bounds = cull_bounds
+
+            state.scissors = scissors
+            state.scissor_origin = scissor_origin
+            if len(scissors) > 0:
+                state.apply_scissor()
+            state.forget()
+
+            cache.render_count += 1
+            # Textures still loading show as placeholders, so try again later.
+            cache.dirty = len(self.texture_cache.pending) > 0
+
+        # Blending while rendering has already multiplied the colors of the
+        # image by their alpha.
+        corners = numpy.array(((0, 0), (1, 0), (1, 1), (0, 1)), dtype=numpy.float32)
+        renderer.add_textured_region(
+            corners * numpy.array((width, height), dtype=numpy.float32), corners,
+            cache.offscreen.texture_color, (x, y), premultiplied=True)
+
+    def draw_shape(self, renderer, origin_x, origin_y):
+        """
+        Draw the morph alone, without its children, with the origin of its World
+        at (origin_x, origin_y) of the region. This is what the World calls for
+        each morph of its display list, see World.compile_display_list().
+        """
+        if self._transform_dirty:
+            self.update_transform()
+        position_x = origin_x + self._absolute_offset[0]
+        position_y = origin_y + self._absolute_offset[1]
+
+        texture = None
+        uv_rect = None
+        tex_coords = None
+        if len(self.textures) > 0:
+            self.draw_count = self.draw_count + 1
+            entry = self.textures[self.active_texture]['cache_entry']
+            # While the texture is still loading in the background, the color
+            # of the morph is used until it's ready.
+            texture = entry['texture']
+            uv_rect = entry['uv_rect']
+
+        # The shape shader needs no geometry, only the size and corners.
+        outline = None
+        if not renderer.use_sdf:
+            if self._geometry_dirty:
+                self.build_geometry()
+            outline = self._outline
+            tex_coords = self._tex_coords
+
+        # Morphs with the same key have the same shape, so a run of them, like
+        # the cells of a grid, can be drawn instanced.
+        width, height = self.shape_size()
+        radii = self.shape_radii()
+        renderer.add_instance(
+            (self.circle, width, height, tuple(radii)), outline, width, height, radii,
+            position_x, position_y, self.color, texture, uv_rect, tex_coords)
+
+    def build_geometry(self):
+        """
+        Compute the shape of the morph in local coordinates, meaning that the
+        lower left corner of the morph is at [0,0], and keep it until something
+        that changes the shape (size, scale, corners, circle or texture) marks
+        it as dirty. Textured morphs also keep the texture coordinates of
+        each point. This is called by draw() when needed.
         """
-        self._width = self.real_width * self.get_absolute_scale()
-        self._height = self.real_height * self.get_absolute_scale()
-        if self.parent == self.world:
-            self._position = self.real_position
-        else:
-            self._position = [self.real_position[0] * self.get_absolute_scale(),
-                              self.real_position[1] * self.get_absolute_scale()]
-        position_x = self.get_absolute_position(
-        )[0] - self.world.draw_area_position[0]
-        position_y = self.get_absolute_position(
-        )[1] - self.world.draw_area_position[1]
         width = self._width
         height = self._height
 
-        bgl.glEnable(bgl.GL_BLEND)
+        if self.circle:
+            # Circle radius and center.
+            circleR = float(width / 2)
+            pos = morpheas_tools.drawCircles(circleR, circleR, circleR, 360)[0]
+        elif self.round_corners and len(self.textures) == 0:
+            pos = morpheas_tools.roundCornersBatch(
+                0, 0, width, height,
+                self.round_corners_strength,
+                self.round_corners_strength, self.round_corners_select)[0]
+        else:
+            pos = numpy.array(((0, 0), (width, 0), (width, height), (0, height)),
+                              dtype=numpy.float32)
+
+        self.set_geometry(pos)
 
-        # If the morph is not hidden and a texture is given.
-        if (not self.is_hidden) and (not len(self.textures) == 0):
-            self.draw_count = self.draw_count + 1
+    def set_geometry(self, outline):
+        """
+        Keep outline, an (N, 2) array of points in local coordinates, as the
+        shape of the morph and, if it's textured, compute the texture
+        coordinates of its points.
+        """
+        self._outline = outline
+        self._tex_coords = None
+
+        if len(self.textures) > 0:
+            # Map the outline to the texture, the texture covers the whole
+            # bounding box of the morph. If the texture is part of an atlas,
+            # only its own rectangle of the atlas is used.
+            u1, v1, u2, v2 = self.textures[self.active_texture]['cache_entry']['uv_rect']
+            width, height = self.shape_size()
+            scale = numpy.array((
+                (u2 - u1) / width if width else 0.0,
+                (v2 - v1) / height if height else 0.0), dtype=numpy.float32)
+            self._tex_coords = numpy.array((u1, v1), dtype=numpy.float32) + outline * scale
+
+        self._geometry_dirty = False
+
+    def invalidate_geometry(self, recursive=False):
+        """
+        Mark the cached shape of the morph as outdated so it is built again the
+        next time the morph is drawn. Setting any of the attributes that affect
+        the shape does this automatically, you only need to call it if you
+        changed the shape some other way, for example in a subclass.
+        If recursive is True, the children are invalidated as well.
+        """
+        self._geometry_dirty = True
+        if self._world is not None:
+            self._world._geometry_dirty_morphs.add(self)
+        self.invalidate_render_cache()
+        if recursive:
+            for child in self.children:
+                child.invalidate_geometry(True)
+
+    @property
+    def cache_rendering(self):
+        """
+        Return True if the morph keeps an image of itself and its children.
+        """
+        return self._render_cache is not None
+
+    @cache_rendering.setter
+    def cache_rendering(self, value):
+        """
+        Enable to render the morph and its children once into an image and
+        draw them as a single textured rectangle from then on. The image is
+        rendered again only when something inside changes. Use it for panels
+        of many morphs that rarely change. Changes Morpheas can't see, like
+        drawing done by a subclass, need a call to invalidate_render_cache().
+        """
+        if value == (self._render_cache is not None):
+            return
+        if value:
+            self._render_cache = RenderCache()
+        else:
+            self._render_cache.free()
+            self._render_cache = None
+        # The World draws cached morphs differently.
+        if self._parent is not None:
+            self._parent.invalidate_display_list()
 
-            at = self.textures[self.active_texture]
+    def invalidate_render_cache(self):
+        """
+        Mark the images of the morph and of all morphs containing it that
+        cache their rendering as outdated, so they are rendered again.
+        """
+        morph = self
+        while morph is not None:
+            if morph._render_cache is not None:
+                morph._render_cache.dirty = True
+            morph = morph._parent
 
-            image = at['image']
+    @property
+    def scale(self):
+        """
+        Return the scale of the morph.
+        """
+        return self._scale
 
-            shader = gpu.shader.from_builtin('2D_IMAGE')
+    @scale.setter
+    def scale(self, value):
+        """
+        Change the scale of the morph. Scale affects the size of all children
+        as well, so their shapes have to be built again.
+        """
+        self._scale = value
+        self.invalidate_transform()
+        self.update_bounds()
+        self.invalidate_render_cache()
 
-            if image.gl_load():
-                raise Exception()
+    @property
+    def style(self):
+        """
+        Return the MorphStyle of the morph, shared with morphs that look the same.
+        """
+        return self._style
 
-            # If there is a texture and circle is enabled, create a circle and
-            # apply the texture to it.
-            if self.circle:
-                pos = []
-                texCoord = []
+    @style.setter
+    def style(self, value):
+        """
+        Give the morph the look of another, for example morph.style = other.style.
+        """
+        old = self._style
+        if value is old:
+            return
+        self._style = value
+        self.invalidate_render_cache()
+        if (value.round_corners != old.round_corners or
+                value.round_corners_strength != old.round_corners_strength or
+                value.round_corners_select != old.round_corners_select):
+            self.invalidate_geometry()
+        if value.circle != old.circle:
+            self.invalidate_geometry()
+            self.update_bounds(True)
+            if self._world is not None:
+                self._world._index_dirty.add(self)
 
-                angle = 0.0
+    @property
+    def color(self):
+        """
+        Return the color of the morph as a tuple (r, g, b, alpha).
+        """
+        return self._style.color
 
-                # Circle radius and center.
-                circleR = float(width / 2)
-                circleCenter = [position_x +
-                                circleR, position_y + circleR]
+    @color.setter
+    def color(self, value):
+        self._style = self._style.replace(color=value)
+        self.invalidate_render_cache()
 
-                while angle < 360.0:
-                    radian = angle * (math.pi / 180.0)
-                    xcos = float(math.cos(radian))
-                    ysin = float(math.sin(radian))
-                    x = xcos * circleR + circleCenter[0]
-                    y = ysin * circleR + circleCenter[1]
-                    tx = xcos * 0.5 + 0.5
-                    ty = ysin * 0.5 + 0.5
-                    texCoord.append((tx, ty))
-                    pos.append((x, y))
+    @property
+    def round_corners(self):
+        """
+        Return whether the morph has round corners.
+        """
+        return self._style.round_corners
 
-                    angle += 1.0
+    @round_corners.setter
+    def round_corners(self, value):
+        self.style = self._style.replace(round_corners=value)
 
-            else:
-                # Draw a simple rectangle with the dimensions, position and scale of the Morph.
-                # Use the active texture as texture of the rectangle.
-                pos = [
-                    (position_x, position_y),
-                    ((position_x + width), position_y),
-                    ((position_x + width), (position_y + height)),
-                    (position_x, (position_y + height))
-                ]
-                texCoord = [
-                    (0, 0), (1, 0), (1, 1), (0, 1)
-                ]
-
-            batch = batch_for_shader(
-                shader, 'TRI_FAN',
-                {
-                    "pos": tuple(pos),
-                    "texCoord": tuple(texCoord),
-                },
-            )
-            bgl.glActiveTexture(bgl.GL_TEXTURE0)
-            bgl.glBindTexture(bgl.GL_TEXTURE_2D, image.bindcode)
-            shader.bind()
-            shader.uniform_int("image", 0)
-            batch.draw(shader)
-
-        # If morph is not hidden and no texture is given, create a simple rectangle,
-        # with the option to have rounded corners.
-        elif (not self.is_hidden) and (len(self.textures) == 0):
-            if self.round_corners:
-                outline = morpheas_tools.roundCorners(
-                    position_x, position_y,
-                    position_x +
-                    width, position_y + height,
-                    self.round_corners_strength,
-                    self.round_corners_strength, self.round_corners_select)
-                morpheas_tools.drawRegion(outline, self.color)
-            elif self.circle:
-                angle = 0.0
-
-                points = []
-
-                circleR = float(width / 2)
-                circleCenter = [position_x +
-                                circleR, position_y + circleR]
-
-                while angle < 360.0:
-                    radian = angle * (math.pi / 180.0)
-                    xcos = float(math.cos(radian))
-                    ysin = float(math.sin(radian))
-                    x = xcos * circleR + circleCenter[0]
-                    y = ysin * circleR + circleCenter[1]
-                    new_point = [x, y]
-                    points.append(new_point)
-
-                    angle += 1.0
-                morpheas_tools.drawRegion(points, self.color)
-            else:
-                outline = morpheas_tools.roundCorners(
-                    position_x, position_y,
-                    position_x +
-                    width, position_y + height,
-                    10, 10, [False, False, False, False])
+    @property
+    def round_corners_strength(self):
+        """
+        Return how much the corners of the morph are rounded.
+        """
+        return self._style.round_corners_strength
 
-                morpheas_tools.drawRegion(outline, self.color)
+    @round_corners_strength.setter
+    def round_corners_strength(self, value):
+        self.style = self._style.replace(round_corners_strength=value)
 
-        bgl.glDisable(bgl.GL_BLEND)
+    @property
+    def round_corners_select(self):
+        """
+        Return which corners of the morph are rounded, as a tuple.
+        """
+        return self._style.round_corners_select
 
-        # If morph is not hidden, also draw all its children.
-        if (not self.is_hidden) and len(self.children) > 0:
-            for child_morph in self.children:
-                child_morph.draw(context)
+    @round_corners_select.setter
+    def round_corners_select(self, value):
+        self.style = self._style.replace(round_corners_select=value)
+
+    @property
+    def circle(self):
+        """
+        Return whether the morph is a circle.
+        """
+        return self._style.circle
+
+    @circle.setter
+    def circle(self, value):
+        self.style = self._style.replace(circle=value)
 
     @property
     def world(self):
@@ -553,7 +2386,28 @@ class Morph:
 
     @world.setter
     def world(self, value):
+        """
+        Change the World of the morph and of all its children. Both the old
+        and the new World are told, so they can update their spatial index
+        and their registry of names.
+        """
+        if self._world is not None and self._world is not value:
+            self._world._index_dirty.add(self)
+            self._world.dragged_morphs.discard(self)
+            self._world.hovered_morphs.discard(self)
+            self._world._geometry_dirty_morphs.discard(self)
+            self._world.unregister_name(self, self._name)
         self._world = value
+        self._visibility_generation = -1
+        if value is not None:
+            value._index_dirty.add(self)
+            value.register_name(self, self._name)
+            if self._geometry_dirty:
+                value._geometry_dirty_morphs.add(self)
+            if self._drag_drop:
+                value.dragged_morphs.add(self)
+        for child in self.children:
+            child.world = value
 
     @property
     def parent(self):
@@ -568,19 +2422,82 @@ class Morph:
     def parent(self, value):
         self._parent = value
 
+    @property
+    def drag_drop(self):
+        """
+        Return True if the morph is being dragged.
+        """
+        return self._drag_drop
+
+    @drag_drop.setter
+    def drag_drop(self, value):
+        """
+        Start or stop dragging the morph. The World keeps track of the morphs
+        being dragged so it does not have to look for them on every mouse move.
+        """
+        self._drag_drop = value
+        world = self.world
+        if world is not None:
+            if value:
+                world.dragged_morphs.add(self)
+            else:
+                world.dragged_morphs.discard(self)
+
     @property
     def is_hidden(self):
         """
-        Check is Morph is hidden.
+        Check is Morph is hidden, either by itself or because a morph that
+        contains it is hidden. The answer is cached until the visibility of
+        any morph of the World changes, see World.visibility_generation.
+        Hiding the World hides all its morphs.
         """
-        return self._is_hidden
+        world = self._world
+        if world is None:
+            morph = self
+            while morph is not None:
+                if morph._is_hidden:
+                    return True
+                morph = morph._parent
+            return False
+
+        if self._visibility_generation != world.visibility_generation:
+            parent = self._parent
+            self._effective_hidden = self._is_hidden or (
+                parent is not None and parent.is_hidden)
+            self._visibility_generation = world.visibility_generation
+        return self._effective_hidden
 
     @is_hidden.setter
     def is_hidden(self, value):
-        for morph in self.children:
-            if morph.is_hidden != value:
-                morph.is_hidden = value
+        """
+        Hide or show the morph and with it all its children. The children
+        keep their own setting, so a child hidden on its own stays hidden
+        when its parent is shown again.
+        """
+        if value == self._is_hidden:
+            return
         self._is_hidden = value
+        self.invalidate_visibility()
+        # Hidden morphs don't count in the bounds of their parent.
+        self.update_bounds()
+        if self._parent is not None:
+            self._parent.invalidate_render_cache()
+
+    @property
+    def is_hidden_locally(self):
+        """
+        Return True if the morph itself is hidden, no matter its parents.
+        """
+        return self._is_hidden
+
+    def invalidate_visibility(self):
+        """
+        Tell the World the visibility of morphs may have changed, so all
+        cached answers of is_hidden are computed again when asked.
+        """
+        world = self.world_of_children()
+        if world is not None:
+            world.visibility_generation += 1
 
     @property
     def name(self):
@@ -592,76 +2509,445 @@ class Morph:
     @name.setter
     def name(self, new_name):
         """
-        Change morph's name.
+        Change morph's name.
+        """
+        if self._world is not None:
+            self._world.unregister_name(self, self._name)
+            self._world.register_name(self, new_name)
+        self._name = new_name
+
+    # Not in core.
+    def delete(self):
+        """
+        Delete morph and all children morphs. Kind of macabre...
+        """
+        for child in self.children:
+            child.delete()
+
+        # Give back all the textures of the morph, the cache frees them
+        # when no other morph uses them.
+        for texture in self.textures.values():
+            self.texture_cache.release(texture['cache_entry'])
+        self.textures.clear()
+
+        if self._render_cache is not None:
+            self._render_cache.free()
+
+    # Not in core.
+    def get_absolute_position(self):
+        """
+        Morpheas uses relative position in relation to the 3D Viewport.
+        So to get the right coordinates we need to adjust them.
+        Previous implementation where morphs had relative position to their
+        parents did not work...
+        The offset from the World is cached, only the position of the World
+        itself, which changes with the region that draws, is added each time.
+        """
+        if self._transform_dirty:
+            self.update_transform()
+        world = self.world
+        if world is None:
+            return self._absolute_offset
+        origin = world.get_absolute_position()
+        return (origin[0] + self._absolute_offset[0],
+                origin[1] + self._absolute_offset[1])
+
+    def get_absolute_scale(self):
+        """
+        Goes through all the parents and combines their scaling.
+        """
+        if self._transform_dirty:
+            self.update_transform()
+        return self._absolute_scale
+
+    def update_transform(self):
+        """
+        Compute the cached absolute scale, scaled size and position, and
+        offset from the World of the morph. Called automatically when the
+        cache is read after an invalidation, so only the morphs that have
+        changed since are computed again, each parent at most once.
+        """
+        old_scale = self._absolute_scale
+        parent = self.parent
+        if parent is None:
+            self._absolute_scale = self.scale
+            self._position = (self.real_position[0], self.real_position[1])
+            self._absolute_offset = (self._position[0], self._position[1])
+        else:
+            if parent._transform_dirty:
+                parent.update_transform()
+            self._absolute_scale = self.scale * parent._absolute_scale
+            if parent is self.world:
+                self._position = self.real_position
+            else:
+                self._position = (self.real_position[0] * self._absolute_scale,
+                                  self.real_position[1] * self._absolute_scale)
+            offset = parent._content_offset
+            self._absolute_offset = (parent._absolute_offset[0] + self._position[0] + offset[0],
+                                     parent._absolute_offset[1] + self._position[1] + offset[1])
+            if parent._placed_children is not None:
+                # Scrolling the parent only has to invalidate the children
+                # whose transform is known, see ScrollMorph.
+                parent._placed_children.add(self)
+
+        width = self.real_width * self._absolute_scale
+        height = self.real_height * self._absolute_scale
+        if width != self._width or height != self._height:
+            self._width = width
+            self._height = height
+            self.invalidate_geometry()
+            self.invalidate_bounds()
+        elif self._absolute_scale != old_scale:
+            # The positions of the children are scaled too.
+            self.invalidate_bounds()
+
+        self._transform_dirty = False
+
+    def invalidate_transform(self):
+        """
+        Mark the cached transform of the morph and all its children as outdated.
+        Children of an outdated morph are always outdated too, so there is no
+        need to go any deeper when we find one.
+        """
+        if self._transform_dirty:
+            return
+        self._transform_dirty = True
+        if self._world is not None:
+            self._world._index_dirty.add(self)
+        for child in self.children:
+            child.invalidate_transform()
+
+    @property
+    def bounds(self):
+        """
+        Return the bounds [x1, y1, x2, y2] of the morph and all its visible
+        children in the coordinates of its parent, the same coordinates
+        position_scaled uses.
+        """
+        bounds = self.get_parent_bounds()
+        if bounds is None:
+            # Hidden morphs take no space in their parent, but still have bounds.
+            x, y = self._position
+            local = self.get_local_bounds()
+            return [x + local[0], y + local[1], x + local[2], y + local[3]]
+        return list(bounds)
+
+    @property
+    def local_bounds(self):
+        """
+        Return the bounds [x1, y1, x2, y2] of the morph and all its visible
+        children relative to the lower left corner of the morph.
+        """
+        return list(self.get_local_bounds())
+
+    @property
+    def absolute_bounds(self):
+        """
+        Return the bounds [x1, y1, x2, y2] of the morph and all its visible
+        children in the same coordinates as get_absolute_position().
+        """
+        x, y = self.get_absolute_position()
+        local = self.get_local_bounds()
+        return [x + local[0], y + local[1], x + local[2], y + local[3]]
+
+    def get_subtree_bounds(self):
+        """
+        Return the bounds [x1, y1, x2, y2] of the morph and all its visible
+        children in World coordinates, the coordinates of the spatial index.
+        """
+        if self._transform_dirty:
+            self.update_transform()
+        x, y = self._absolute_offset
+        local = self.get_local_bounds()
+        return [x + local[0], y + local[1], x + local[2], y + local[3]]
+
+    def get_local_bounds(self):
+        """
+        Return the cached local bounds, computing them from the shape of the
+        morph and the bounds of its children if they are outdated. Don't
+        modify the returned list.
+        """
+        # A change of scale is only found when the transform is updated.
+        if self._transform_dirty:
+            self.update_transform()
+        if self._bounds_dirty:
+            width, height = self.shape_size()
+            bounds = [0, 0, width, height]
+            for child in self.children:
+                child_bounds = child.get_parent_bounds()
+                if child_bounds is None:
+                    continue
+                if bounds[0] > child_bounds[0]:
+                    bounds[0] = child_bounds[0]
+                if bounds[1] > child_bounds[1]:
+                    bounds[1] = child_bounds[1]
+                if bounds[2] < child_bounds[2]:
+                    bounds[2] = child_bounds[2]
+                if bounds[3] < child_bounds[3]:
+                    bounds[3] = child_bounds[3]
+            self._local_bounds = bounds
+            self._bounds_dirty = False
+        return self._local_bounds
+
+    def get_parent_bounds(self):
+        """
+        Return the bounds the morph takes in its parent, or None if it's
+        hidden, and remember them as the part the parent knows about.
+        """
+        if self._is_hidden:
+            bounds = None
+        else:
+            if self._transform_dirty:
+                self.update_transform()
+            x, y = self._position
+            local = self.get_local_bounds()
+            bounds = (x + local[0], y + local[1], x + local[2], y + local[3])
+        self._parent_bounds = bounds
+        return bounds
+
+    def update_bounds(self, changed_shape=False):
+        """
+        Bring the bounds of the parents of the morph up to date after it has
+        moved, resized, been added or hidden. Set changed_shape if the morph
+        itself changed size. See child_bounds_changed().
+        """
+        if changed_shape:
+            self._bounds_dirty = True
+        parent = self._parent
+        if parent is None or parent._bounds_dirty:
+            return
+        old = self._parent_bounds
+        new = self.get_parent_bounds()
+        parent.child_bounds_changed(old, new)
+
+    def child_bounds_changed(self, old, new):
+        """
+        Update the bounds of the morph and of its parents after one of its
+        children, which took the bounds old in it, now takes new. None means
+        the child takes no space, because it is hidden, new or removed.
+        Each morph is updated in place from the old and new bounds of its
+        child. Only when the child used to touch an edge of the morph, so
+        the morph may have shrunk, are its bounds computed again from all
+        its children. Morphs already outdated are left for later.
+        """
+        morph = self
+        while not morph._bounds_dirty and old != new:
+            bounds = morph._local_bounds
+            if old is not None and (old[0] <= bounds[0] or old[1] <= bounds[1] or
+                                    old[2] >= bounds[2] or old[3] >= bounds[3]):
+                morph._bounds_dirty = True
+            elif new is not None:
+                morph._local_bounds = [
+                    min(bounds[0], new[0]), min(bounds[1], new[1]),
+                    max(bounds[2], new[2]), max(bounds[3], new[3])]
+            else:
+                return
+
+            parent = morph._parent
+            if parent is None or parent._bounds_dirty:
+                return
+            old = morph._parent_bounds
+            new = morph.get_parent_bounds()
+            morph = parent
+
+    def invalidate_bounds(self):
+        """
+        Mark the cached bounds of the morph and of all morphs that contain it
+        as outdated, so they are computed again when needed. The parents of
+        an outdated morph are always outdated too, so we stop at the first
+        one we find.
+        """
+        morph = self
+        while morph is not None and not morph._bounds_dirty:
+            morph._bounds_dirty = True
+            morph = morph._parent
+
+    def is_culled(self):
+        """
+        Return True if the morph and all its children are outside the area
+        the World is drawing, so there is no need to draw any of them.
+        Always False when not drawn by a World.
+        """
+        world = self._world
+        if world is None or world.cull_bounds is None:
+            return False
+        area = world.cull_bounds
+        bounds = self.get_subtree_bounds()
+        return (bounds[2] <= area[0] or bounds[0] >= area[2] or
+                bounds[3] <= area[1] or bounds[1] >= area[3])
+
+    def is_clipped(self):
+        """
+        Return True if the morph is inside a morph that clips its children,
+        like a ScrollMorph.
+        """
+        morph = self._parent
+        while morph is not None:
+            if morph.clips_children:
+                return True
+            morph = morph._parent
+        return False
+
+    def add_morph(self, morph):
+        """
+        Add the Morph as a child to another Morph, the other Morph becomes its parent.
+        If the Morph already has a parent, it is moved from it.
+        It is drawn on top of the other children, see also add_morphs().
+        """
+        self.add_morphs([morph])
+
+    def add_morphs(self, morphs, index=None):
+        """
+        Add many morphs as children at once, in the given order. They are
+        inserted before the child at index, or on top of all others if index
+        is None. Morphs that already have a parent are moved from it.
+        The bounds are updated once for all of them.
+        """
+        # morphs is gone through twice, it may be a generator.
+        morphs = list(morphs)
+        world = self.world_of_children()
+        added = None
+        for morph in morphs:
+            if morph.parent is not None:
+                morph.parent.detach_morph(morph)
+            morph.parent = self
+            morph.world = world
+
+            # The new parent has a different position and may have a different scale.
+            morph.invalidate_transform()
+            morph._parent_bounds = None
+            if not self._bounds_dirty:
+                bounds = morph.get_parent_bounds()
+                if bounds is not None:
+                    if added is None:
+                        added = list(bounds)
+                    else:
+                        added = [min(added[0], bounds[0]), min(added[1], bounds[1]),
+                                 max(added[2], bounds[2]), max(added[3], bounds[3])]
+
+        if index is None:
+            self.children.extend(morphs)
+        else:
+            self.children[index:index] = morphs
+        # The new children may now be inside a hidden morph.
+        self.invalidate_visibility()
+        self.invalidate_display_list()
+
+        self.child_bounds_changed(None, added)
+
+    def world_of_children(self):
+        """
+        Return the World children added to this morph belong to.
         """
-        self._name = new_name
+        return self.world
 
-    # Not in core.
-    def delete(self):
+    def invalidate_display_list(self):
         """
-        Delete morph and all children morphs. Kind of macabre...
+        Tell the World the children of the morph have changed, so its display
+        list has to be compiled again, and so have the images of the morphs
+        containing them that cache their rendering.
         """
-        for child in self.children:
-            child.delete()
-        try:
-            self.image.user_clear()
-            self.image.gl_free()
-            bpy.data.images.remove(self.image)
-            self.textures.clear()
-        except:
-            pass
+        world = self.world_of_children()
+        if world is not None:
+            world._display_list = None
+            world._event_overrides = None
+        self.invalidate_render_cache()
 
-    # Not in core.
-    def get_absolute_position(self):
+    def remove_morph(self, morph):
         """
-        Morpheas uses relative position in relation to the 3D Viewport.
-        So to get the right coordinates we need to adjust them.
-        Previous implementation where morphs had relative position to their
-        parents did not work...
+        Remove a child morph and return it. The morph and its children leave
+        the World, but keep everything else, so they can be added again.
         """
-        if self.parent is not None:
-            return (self.parent.get_absolute_position()[0] + self._position[0],
-                    self.parent.get_absolute_position()[1] + self._position[1])
-
-        else:
-            return self._position
+        self.detach_morph(morph)
+        morph.world = None
+        return morph
 
-    def get_absolute_scale(self):
+    def detach_morph(self, morph):
         """
-        Goes through all the parents and combines their scaling.
+        Internal, take a child out of the children, leaving its World as it is.
         """
-        if self.parent is not None:
-            return self.scale * self.parent.get_absolute_scale()
-        else:
-            return self.scale
+        self.children.remove(morph)
+        self.invalidate_visibility()
+        self.invalidate_display_list()
+        old = morph._parent_bounds
+        morph._parent_bounds = None
+        morph.parent = None
+        morph.invalidate_transform()
+        self.child_bounds_changed(old, None)
+
+    def bring_to_front(self):
+        """
+        Move the morph on top of all its siblings, it is drawn after them.
+        """
+        siblings = self.parent.children
+        if siblings[-1] is not self:
+            siblings.remove(self)
+            siblings.append(self)
+            self.parent.invalidate_display_list()
 
-    def add_morph(self, morph):
+    def send_to_back(self):
         """
-        Add the Morph as a child to another Morph, the other Morph becomes its parent.
+        Move the morph below all its siblings, it is drawn before them.
         """
+        siblings = self.parent.children
+        if siblings[0] is not self:
+            siblings.remove(self)
+            siblings.insert(0, self)
+            self.parent.invalidate_display_list()
 
-        morph.parent = self
-        morph.world = self.world
-        self.children.append(morph)
+    def move_to_index(self, index):
+        """
+        Move the morph to the given place among its siblings, 0 being the
+        bottom. Use raise_morph() and lower_morph() to move it by one place.
+        """
+        siblings = self.parent.children
+        current = siblings.index(self)
+        index = max(0, min(index, len(siblings) - 1))
+        if index != current:
+            del siblings[current]
+            siblings.insert(index, self)
+            self.parent.invalidate_display_list()
+
+    def raise_morph(self):
+        """
+        Move the morph one place up among its siblings.
+        """
+        siblings = self.parent.children
+        index = siblings.index(self)
+        if index + 1 < len(siblings):
+            siblings[index], siblings[index + 1] = siblings[index + 1], siblings[index]
+            self.parent.invalidate_display_list()
 
-        if self.bounds[0] > morph.bounds[0]:
-            self.bounds[0] = morph.bounds[0]
-        if self.bounds[1] > morph.bounds[1]:
-            self.bounds[1] = morph.bounds[1]
-        if self.bounds[2] < morph.bounds[2]:
-            self.bounds[2] = morph.bounds[2]
-        if self.bounds[3] < morph.bounds[3]:
-            self.bounds[3] = morph.bounds[3]
+    def lower_morph(self):
+        """
+        Move the morph one place down among its siblings.
+        """
+        siblings = self.parent.children
+        index = siblings.index(self)
+        if index > 0:
+            siblings[index], siblings[index - 1] = siblings[index - 1], siblings[index]
+            self.parent.invalidate_display_list()
 
     def get_child_morph_named(self, name):
         """
-        Returns a child morph of a specific name.
+        Returns a morph of a specific name contained in this morph, directly
+        or inside its children. If more than one have that name, the one
+        that joined the World first is returned. Morphs that are part of a
+        World are found through its registry of names, without searching.
         """
+        world = self.world
+        if world is not None:
+            for morph in world._names.get(name, ()):
+                if morph is not self and morph.is_inside(self):
+                    return morph
+            return None
+
         for child in self.children:
             if child.name == name:
                 return child
-            else:
-                child.get_child_morph_named(name)
+            found = child.get_child_morph_named(name)
+            if found is not None:
+                return found
         return None
 
     def get_child_morph_named_index(self, name):
@@ -669,6 +2955,13 @@ class Morph:
         Returns the index of a morph in the children list,
         useful for deleting the morph.
         """
+        world = self.world
+        if world is not None:
+            for morph in world._names.get(name, ()):
+                if morph.parent is self:
+                    return self.children.index(morph)
+            return None
+
         index = 0
         for child in self.children:
             if child.name == name:
@@ -676,6 +2969,17 @@ class Morph:
             index += 1
         return None
 
+    def is_inside(self, morph):
+        """
+        Return True if this morph is morph or is contained in it.
+        """
+        current = self
+        while current is not None:
+            if current is morph:
+                return True
+            current = current.parent
+        return False
+
     # Upper left and lower right corners of the bounding box,
     # defining the area occupied by the morph.
 
@@ -705,24 +3009,34 @@ class Morph:
 
     def on_event(self, event, context):
         """
-        This is also an internal method called by the World morph, that acts as the general
-        mechanism for figuring out the type event it received and sending it to the appropriate
-        specialised method. Generally this should not be overridden by your classes unless you
-        want to override the general event behavior of the morph. For specific event override,
-        call the relevant methods instead.
+        This is the general mechanism for figuring out the type of event the morph and its
+        children received and sending it to the appropriate specialised method.
+        The World sends events straight to the morphs under the mouse, it calls on_event only
+        for morphs whose class overrides it, and then leaves the morph and its children to it.
+        Generally this should not be overridden by your classes unless you want to override
+        the general event behavior of the morph. For specific event override, override the
+        relevant methods instead.
         """
 
+        # Hidden morphs and their children don't handle events.
+        if self._is_hidden:
+            return
+
         if len(self.children) > 0:
             for morph in self.children:
                 morph.on_event(event, context)
 
-        if self.handles_events and not self.is_hidden and not self.world.consumed_event:
+        if self.handles_events and not self.world.consumed_event:
             if event.type in {'LEFTMOUSE', 'RIGHTMOUSE'}:
                 self.on_mouse_click(event)
 
             elif event.type in {'MOUSEMOVE'}:
                 self.on_mouse_over(event)
 
+            elif event.type in {'WHEELUPMOUSE', 'WHEELDOWNMOUSE'}:
+                if self.mouse_over_morph:
+                    self.on_mouse_wheel(event)
+
     def on_mouse_click(self, event):
         """
         An event when any mouse button is pressed or released.
@@ -742,10 +3056,22 @@ class Morph:
     def on_mouse_over(self, event):
         """
         Αn event when the mouse cursor passes over the area occupied by the morph.
+        The World tells morphs only when the mouse enters or leaves them, it calls this on
+        every move only for morphs whose class overrides it.
         """
         if self.drag_drop:
-            cancel_drag = False
+            self.on_drag(event)
+        if self.mouse_over_morph:
+            return self.on_mouse_in()
+        else:
+            return self.on_mouse_out()
 
+    def on_drag(self, event):
+        """
+        Move the morph with the mouse while it is being dragged, unless it
+        would collide with another morph.
+        """
+        if self.drag_drop:
             offset = [
                 self.world.mouse_position[0] - self.drag_position[0],
                 self.world.mouse_position[1] - self.drag_position[1]]
@@ -762,13 +3088,7 @@ class Morph:
             positionY = max(
                 min(viewport_height - self._height, self.position[1] + offset[1]), 0)
 
-            for bigMorph in self.world.children:
-                if bigMorph.name != self.name and bigMorph.is_hidden is False \
-                    and morpheas_tools.collisionDetect(
-                        positionX, positionY, bigMorph.position_scaled[0],
-                        bigMorph.position_scaled[1], self.width_scaled, self.height_scaled,
-                        bigMorph.width_scaled, bigMorph.height_scaled):
-                    cancel_drag = True
+            cancel_drag = self.collides_at([positionX, positionY])
 
             if cancel_drag is False:
                 self.position = [positionX, positionY]
@@ -776,10 +3096,44 @@ class Morph:
                 #     self.position[0] +
                 #     offset[0], self.position[1] + offset[1]]
                 self.drag_position = self.world.mouse_position
-        if self.mouse_over_morph:
-            return self.on_mouse_in()
+
+    def collides_at(self, position):
+        """
+        Return True if the morph, moved to the given position, would collide
+        with any visible morph placed directly in the World. Morphs that only
+        touch its edges don't count. The World's spatial index is used to only
+        check morphs near the new position.
+        """
+        world = self.world
+        world.update_spatial_index()
+
+        # Bounds of the moved morph in World coordinates.
+        parent = self.parent
+        if parent is world:
+            x, y = position
         else:
-            return self.on_mouse_out()
+            scale = self.get_absolute_scale()
+            x = parent._absolute_offset[0] + position[0] * scale
+            y = parent._absolute_offset[1] + position[1] * scale
+        # The same extent the spatial index uses, circles are as tall as wide.
+        width, height = self.shape_size()
+
+        # A morph can't collide with itself or the morphs that contain it.
+        ancestors = set()
+        morph = self
+        while morph is not None:
+            ancestors.add(morph)
+            morph = morph.parent
+
+        others = [other for other in world.spatial_index.query_rect([x, y, x + width, y + height])
+                  if other.parent is world and other not in ancestors and not other.is_hidden]
+        if len(others) == 0:
+            return False
+        rects = numpy.array([(other._absolute_offset[0], other._absolute_offset[1]) +
+                             tuple(other.shape_size()) for other in others],
+                            dtype=numpy.float32)
+        return bool(morpheas_tools.collisionDetectMany(
+            x, y, width, height, rects[:, 0], rects[:, 1], rects[:, 2], rects[:, 3]).any())
 
     # The following methods should be self explanatory and
     # depend on the action classes passed to the morph.
@@ -829,10 +3183,18 @@ class Morph:
         An event for when the mouse exits the area of the Morph.
         """
         if self.on_mouse_out_action is not None:
-            return self.on_mouse_out_action.on_mouse_in(self)
+            return self.on_mouse_out_action.on_mouse_out(self)
         else:
             return self.world.event
 
+    def on_mouse_wheel(self, event):
+        """
+        An event for when the mouse wheel turns over the Morph. Morphs that
+        scroll override it and set consumed_event of the World, else the
+        morphs below get the event.
+        """
+        return self.world.event
+
 
 class World(Morph):
     """
@@ -854,7 +3216,7 @@ class World(Morph):
     them to the world via add_morph method.
     """
 
-    def __init__(self, singular=True, auto_hide=True, **kargs):
+    def __init__(self, singular=True, auto_hide=True, sdf_shapes=False, **kargs):
 
         super().__init__(**kargs)
 
@@ -912,6 +3274,54 @@ class World(Morph):
         # so it depends on self.mouse_cursor_inside.
         self.auto_hide = True
 
+        # The spatial index used to find the morphs under the mouse, and the
+        # morphs that have moved, resized or changed World since it was last
+        # updated. See update_spatial_index().
+        self.spatial_index = SpatialGrid()
+        self._index_dirty = set()
+
+        # The morphs whose shape has to be built again before they are drawn.
+        # They are built together at the start of draw, see build_geometries().
+        self._geometry_dirty_morphs = set()
+
+        # The morphs the mouse is currently over. Mouse in and out events are
+        # sent only when a morph enters or leaves this set.
+        self.hovered_morphs = set()
+
+        # The morphs currently being dragged, see Morph.drag_drop.
+        self.dragged_morphs = set()
+
+        # Increased every time a morph is hidden, shown or moved to another
+        # parent, telling the morphs their cached is_hidden answer is outdated.
+        self.visibility_generation = 0
+
+        # The morphs of the World by name. Each name maps to a dict used as an
+        # ordered set, so morphs sharing a name keep the order they joined
+        # the World in. Kept up to date by the world and name setters.
+        self._names = {}
+
+        # Collects the solid color geometry of all morphs during draw so
+        # it can be sent to the GPU with a single draw call per frame.
+        # If sdf_shapes is True, shapes are drawn by the shape shader instead
+        # of being turned into triangles, see Renderer.
+        self.gpu_state = GPUState()
+        self.renderer = Renderer(sdf_shapes, self.gpu_state)
+
+        # The morphs of the World in drawing order, compiled from the tree when
+        # it changes so drawing doesn't have to walk it, or None when it has
+        # to be compiled again. See compile_display_list().
+        self._display_list = None
+
+        # The morphs whose class overrides on_event and those overriding
+        # on_mouse_over, found when the tree changes, or None when they have
+        # to be found again. See compile_event_overrides().
+        self._event_overrides = None
+
+        # The part of the World visible in the draw area, [x1, y1, x2, y2] in
+        # World coordinates. Set only while drawing, morphs completely outside
+        # of it are not drawn, see Morph.is_culled().
+        self.cull_bounds = None
+
         self._width = 2000
         self._height = 2000
 
@@ -923,10 +3333,25 @@ class World(Morph):
         return [self.position[0] + self.draw_area_position[0],
                 self.position[1] + self.draw_area_position[1]]
 
+    def update_transform(self):
+        """
+        The World is the origin of the offsets of its morphs, its own position
+        is added by get_absolute_position.
+        """
+        self._absolute_scale = self.scale
+        self._position = self.real_position
+        self._absolute_offset = (0, 0)
+        self._transform_dirty = False
+
     def disable_all_drag_drop(self, morph):
         """
         With a morph given(the world), recursively disable all drag_drops.
         """
+        if morph is self:
+            # The World already knows which morphs are being dragged.
+            for dragged in list(self.dragged_morphs):
+                dragged.drag_drop = False
+            return
         for child in morph.children:
             child.drag_drop = False
             self.disable_all_drag_drop(child)
@@ -971,27 +3396,96 @@ class World(Morph):
                 self.mouse_position = [
                     self.mouse_position_absolute[0] - self.draw_area[0],
                     self.mouse_position_absolute[1] - self.draw_area[1]]
-                for child in self.children:
-                    child.draw(self.draw_area_context)
-                    # context.area.tag_redraw()
-
-    def add_morph(self, morph):
+                # Upload some of the textures decoded in the background, and
+                # keep redrawing until all of them are in.
+                if len(self.texture_cache.pending) > 0:
+                    if self.texture_cache.process_uploads() > 0:
+                        context.area.tag_redraw()
+
+                # Hiding the World hides all its morphs.
+                if self._is_hidden:
+                    return
+
+                if len(self._geometry_dirty_morphs) > 0:
+                    self.build_geometries()
+
+                self.cull_bounds = [
+                    -self.position[0], -self.position[1],
+                    self.draw_area_width - self.position[0],
+                    self.draw_area_height - self.position[1]]
+
+                self.gpu_state.begin()
+                self.renderer.begin()
+                self.draw_display_list(self.draw_area_context)
+                self.renderer.end()
+                self.gpu_state.end()
+                self.cull_bounds = None
+
+    def world_of_children(self):
         """
         A world cannot have a world by itself and of course neither a parent.
-        This is why we override the Morph add_morph method.
+        Its children belong to it.
         """
-        morph.parent = self
-        morph.world = self
-        self.children.append(morph)
+        return self
 
-        if self.bounds[0] > morph.bounds[0]:
-            self.bounds[0] = morph.bounds[0]
-        if self.bounds[1] > morph.bounds[1]:
-            self.bounds[1] = morph.bounds[1]
-        if self.bounds[2] < morph.bounds[2]:
-            self.bounds[2] = morph.bounds[2]
-        if self.bounds[3] < morph.bounds[3]:
-            self.bounds[3] = morph.bounds[3]
+    def compile_display_list(self):
+        """
+        Flatten the morph tree into the display list, a list with a record
+        (morph, end, opaque) for each morph, parents before their children.
+        end is the index of the first record after the children of the morph,
+        so a hidden or culled morph skips them with a single jump. Morphs of
+        classes with their own draw or draw_children method and morphs caching
+        their rendering are opaque, they are drawn by calling draw and their
+        children are left to it.
+        """
+        records = []
+        base_draw = Morph.draw
+        base_draw_children = Morph.draw_children
+        # Morphs still to add and, for morphs whose children are being added,
+        # the index of their record, so their end is set after the children.
+        stack = [(child, -1) for child in reversed(self.children)]
+        while len(stack) > 0:
+            morph, index = stack.pop()
+            if index >= 0:
+                records[index] = (morph, len(records), records[index][2])
+                continue
+            opaque = (type(morph).draw is not base_draw or
+                      type(morph).draw_children is not base_draw_children or
+                      morph._render_cache is not None)
+            index = len(records)
+            records.append((morph, index + 1, opaque))
+            if not opaque and len(morph.children) > 0:
+                stack.append((morph, index))
+                stack.extend((child, -1) for child in reversed(morph.children))
+        self._display_list = records
+        return records
+
+    def draw_display_list(self, context):
+        """
+        Draw all morphs of the World by going through the display list,
+        compiling it first if the tree has changed.
+        """
+        records = self._display_list
+        if records is None:
+            records = self.compile_display_list()
+
+        renderer = self.renderer
+        origin = self.get_absolute_position()
+        origin_x = origin[0] - self.draw_area_position[0]
+        origin_y = origin[1] - self.draw_area_position[1]
+
+        index = 0
+        count = len(records)
+        while index < count:
+            morph, end, opaque = records[index]
+            if morph._is_hidden or morph.is_culled():
+                index = end
+            elif opaque:
+                morph.draw(context)
+                index = end
+            else:
+                morph.draw_shape(renderer, origin_x, origin_y)
+                index += 1
 
     def on_event(self, event, context):
         """
@@ -1025,36 +3519,394 @@ class World(Morph):
         # That's why we always have good excuses, like university exams or work...
         self.consumed_event = False
 
-        for morph in self.children:
-            morph.on_event(event, context)
+        self.update_spatial_index()
+
+        # Morphs overriding on_event get the event for themselves and their
+        # children through it, the others get it straight from the World.
+        on_event_morphs, mouse_over_morphs = self.get_event_overrides()
+        for morph in on_event_morphs:
+            if not morph.is_hidden:
+                morph.on_event(event, context)
+
+        if event.type in {'LEFTMOUSE', 'RIGHTMOUSE'}:
+            for morph in self.get_morphs_to_dispatch():
+                if self.consumed_event:
+                    break
+                morph.on_mouse_click(event)
+
+        elif event.type in {'MOUSEMOVE'}:
+            # Morphs overriding on_mouse_over are told about every move, it
+            # drags them too.
+            for morph in mouse_over_morphs:
+                if self.consumed_event:
+                    break
+                if morph.handles_events and not morph.is_hidden:
+                    morph.on_mouse_over(event)
+
+            # Dragging moves morphs, so the index is updated after it.
+            for morph in list(self.dragged_morphs):
+                if (morph.handles_events and not morph.is_hidden and
+                        not self.is_event_overridden(morph)):
+                    morph.on_drag(event)
+            # Something was dragged to a new place.
+            moved = len(self._index_dirty) > 0
+            self.update_spatial_index()
+
+            # Only morphs the mouse has entered or left since the last move are
+            # told, and only then does the region need to be drawn again.
+            under_mouse = set(morph for morph in self.get_morphs_to_dispatch()
+                              if morph not in mouse_over_morphs)
+            left = self.hovered_morphs - under_mouse
+            entered = under_mouse - self.hovered_morphs
+            self.hovered_morphs = under_mouse
+
+            for morph in sorted(left, key=self.event_order_key):
+                morph.on_mouse_out()
+            for morph in sorted(entered, key=self.event_order_key):
+                morph.on_mouse_in()
+
+            if (moved or left or entered) and context.area is not None:
+                context.area.tag_redraw()
+
+        elif event.type in {'WHEELUPMOUSE', 'WHEELDOWNMOUSE'}:
+            for morph in self.get_morphs_to_dispatch():
+                if self.consumed_event:
+                    break
+                morph.on_mouse_wheel(event)
+
+            # Something scrolled.
+            if self.consumed_event and context.area is not None:
+                context.area.tag_redraw()
+
+        # Handling the event changed the shape of some morph.
+        if len(self._geometry_dirty_morphs) > 0 and context.area is not None:
+            context.area.tag_redraw()
+
+    def get_event_overrides(self):
+        """
+        Return the morphs whose class overrides on_event and those whose
+        class overrides on_mouse_over, as dicts in on_event order, finding
+        them again if the tree has changed. The children of a morph
+        overriding on_event are left to it.
+        """
+        if self._event_overrides is not None:
+            return self._event_overrides
+
+        base_on_event = Morph.on_event
+        base_on_mouse_over = Morph.on_mouse_over
+        on_event_morphs = []
+        mouse_over_morphs = []
+        stack = list(reversed(self.children))
+        while len(stack) > 0:
+            morph = stack.pop()
+            if type(morph).on_event is not base_on_event:
+                on_event_morphs.append(morph)
+                continue
+            if type(morph).on_mouse_over is not base_on_mouse_over:
+                mouse_over_morphs.append(morph)
+            stack.extend(reversed(morph.children))
+
+        self._event_overrides = (
+            dict.fromkeys(sorted(on_event_morphs, key=self.event_order_key)),
+            dict.fromkeys(sorted(mouse_over_morphs, key=self.event_order_key)))
+        return self._event_overrides
+
+    def is_event_overridden(self, morph):
+        """
+        Return True if morph gets events through a morph overriding on_event,
+        itself or one containing it.
+        """
+        on_event_morphs = self.get_event_overrides()[0]
+        if len(on_event_morphs) == 0:
+            return False
+        while morph is not None and morph is not self:
+            if morph in on_event_morphs:
+                return True
+            morph = morph.parent
+        return False
+
+    def get_morphs_to_dispatch(self):
+        """
+        Return the morphs under the mouse the World sends events to, those
+        not left to a morph overriding on_event.
+        """
+        morphs = self.get_morphs_under_mouse()
+        if len(self.get_event_overrides()[0]) == 0:
+            return morphs
+        return [morph for morph in morphs if not self.is_event_overridden(morph)]
+
+    def build_geometries(self):
+        """
+        Build the shapes of all morphs of this World marked as dirty, doing
+        the same work as Morph.build_geometry but computing all circles, all
+        rounded rectangles with the same corner strength and all plain
+        rectangles with one call each.
+        """
+        morphs = [morph for morph in self._geometry_dirty_morphs
+                  if morph._world is self and morph._geometry_dirty]
+        self._geometry_dirty_morphs.clear()
+        if self.renderer.use_sdf:
+            # The shape shader doesn't need any geometry.
+            return
+
+        circles = []
+        rounded = {}
+        rectangles = []
+        for morph in morphs:
+            if morph.circle:
+                circles.append(morph)
+            elif morph.round_corners and len(morph.textures) == 0:
+                rounded.setdefault(morph.round_corners_strength, []).append(morph)
+            else:
+                rectangles.append(morph)
+
+        if len(circles) > 0:
+            radius = numpy.array([morph._width / 2 for morph in circles], dtype=numpy.float64)
+            outlines = morpheas_tools.drawCircles(radius, radius, radius, 360)
+            for morph, outline in zip(circles, outlines):
+                morph.set_geometry(outline)
+
+        for strength, group in rounded.items():
+            outlines = morpheas_tools.roundCornersBatch(
+                0, 0,
+                [morph._width for morph in group],
+                [morph._height for morph in group],
+                strength, strength,
+                [morph.round_corners_select for morph in group])
+            for morph, outline in zip(group, outlines):
+                morph.set_geometry(outline)
+
+        if len(rectangles) > 0:
+            sizes = numpy.array([(morph._width, morph._height) for morph in rectangles],
+                                dtype=numpy.float32)
+            corners = numpy.array(((0, 0), (1, 0), (1, 1), (0, 1)), dtype=numpy.float32)
+            outlines = corners[None, :, :] * sizes[:, None, :]
+            for morph, outline in zip(rectangles, outlines):
+                morph.set_geometry(outline)
+
+    def register_name(self, morph, name):
+        """
+        Add morph to the registry of names. Called by Morph, you don't need to.
+        """
+        morphs = self._names.get(name)
+        if morphs is None:
+            morphs = self._names[name] = {}
+        morphs[morph] = None
+
+    def unregister_name(self, morph, name):
+        """
+        Remove morph from the registry of names. Called by Morph, you don't need to.
+        """
+        morphs = self._names.get(name)
+        if morphs is not None:
+            morphs.pop(morph, None)
+            if len(morphs) == 0:
+                del self._names[name]
+
+    def get_morph_named(self, name):
+        """
+        Return the morph of the World with the given name, or None. If more
+        than one have that name, the one that joined the World first is returned.
+        """
+        morphs = self._names.get(name)
+        if morphs is None:
+            return None
+        return next(iter(morphs))
+
+    def get_morphs_named(self, name):
+        """
+        Return a list of all the morphs of the World with the given name,
+        in the order they joined the World.
+        """
+        morphs = self._names.get(name)
+        if morphs is None:
+            return []
+        return list(morphs)
+
+    def update_spatial_index(self):
+        """
+        Bring the spatial index up to date with the morphs that have been
+        added, moved or resized since the last update, or removed from this
+        World. Only those morphs are touched. Morphs inside morphs that clip
+        their children are left out, see get_morphs_under_mouse().
+        """
+        index = self.spatial_index
+        for morph in self._index_dirty:
+            if morph._world is self and not morph.is_clipped():
+                if morph._transform_dirty:
+                    morph.update_transform()
+                x, y = morph._absolute_offset
+                width, height = morph.shape_size()
+                index.insert(morph, (x, y, x + width, y + height))
+            else:
+                index.remove(morph)
+        self._index_dirty.clear()
+
+    def get_morphs_under_mouse(self):
+        """
+        Return the visible morphs handling events that are under the mouse,
+        in the order they receive events: children before their parents and
+        earlier siblings first, the same order on_event goes through them.
+        """
+        origin = self.get_absolute_position()
+        x = self.mouse_position_absolute[0] - origin[0]
+        y = self.mouse_position_absolute[1] - origin[1]
+
+        near = self.spatial_index.query_point(x, y)
+        candidates = [morph for morph in near
+                      if morph.handles_events and not morph.is_hidden]
+        # Morphs that clip their children find the children under the mouse.
+        for morph in near:
+            if morph.clips_children and not morph.is_hidden:
+                candidates.extend(morph.get_content_candidates(x, y))
+        if len(candidates) == 0:
+            return candidates
+
+        # Test the mouse against the exact shapes of all candidates at once.
+        # The spatial index was just updated, so the offsets are current.
+        offsets = numpy.array([morph._absolute_offset for morph in candidates],
+                              dtype=numpy.float32)
+        sizes = numpy.array([morph.shape_size() for morph in candidates], dtype=numpy.float32)
+        radii = numpy.array([morph.shape_radii() for morph in candidates], dtype=numpy.float32)
+        inside = morpheas_tools.pointInShapes(
+            x, y, offsets[:, 0], offsets[:, 1], sizes[:, 0], sizes[:, 1], radii)
+        found = [morph for morph, hit in zip(candidates, inside) if hit]
+        if len(found) > 1:
+            found.sort(key=self.event_order_key)
+        return found
+
+    def event_order_key(self, morph):
+        """
+        Sort key that puts morphs in on_event order. It is the path of child
+        indices from the World to the morph, ending with infinity so that
+        a morph comes after all of its children.
+        """
+        path = [math.inf]
+        while morph.parent is not None and morph is not self:
+            path.append(morph.parent.children.index(morph))
+            morph = morph.parent
+        path.reverse()
+        return path
+
 
 
 class TextMorph(Morph):
     """
     TextMorph is a class that defines a simple label, a piece of text of any size.
+    The morph is the box of its text, measured by blf whenever the text,
+    font, size or dpi change, so labels are hit-tested, culled and cached
+    like any other morph. The box goes down to the descent of the font,
+    letters like g and p reach below the baseline, which is that far above
+    the bottom of the morph. Labels that rarely change can be drawn from an
+    image of them with cache_rendering.
     """
 
-    def __init__(self, font_id=0, text="empty string", x=15, y=0, size=16, dpi=72, **kargs):
+    __slots__ = ('_size', '_dpi', '_text', '_font_id', '_metrics_key', '_descent')
+
+    # The descent and the height of a line of each font, by (font_id, size,
+    # dpi), so they are measured only once.
+    font_metrics = {}
+
+    def __init__(self, font_id=0, text="empty string", x=15, y=0, size=16, dpi=72,
+                 cache_rendering=False, **kargs):
         self.real_position = [x, y]
         super().__init__(texture=None, **kargs)
-        self.size = size
-        self.dpi = dpi
-        self.text = text
-        self.font_id = 0
+        self._size = size
+        self._dpi = dpi
+        self._text = text
+        self._font_id = font_id
 
-    def draw(self, context):
-        if not self.is_hidden:
-            position_x = self.get_absolute_position(
-            )[0] - self.world.draw_area_position[0]
-            position_y = self.get_absolute_position(
-            )[1] - self.world.draw_area_position[1]
-            # blf.glColor4f(*self.color)
-            blf.color(
-                0, self.color[0], self.color[1],
-                self.color[2], self.color[3])
-            blf.size(self.font_id, self.size, self.dpi)
-            blf.position(self.font_id, position_x, position_y, 0)
-            blf.draw(self.font_id, self.text)
+        # The font, text, size and dpi the width and height were measured
+        # for, and how far the baseline is above the bottom of the morph.
+        self._metrics_key = None
+        self._descent = 0
+        self.update_metrics()
+
+        self.cache_rendering = cache_rendering
+
+    @property
+    def text(self):
+        return self._text
+
+    @text.setter
+    def text(self, value):
+        self._text = value
+        self.update_metrics()
+
+    @property
+    def size(self):
+        return self._size
+
+    @size.setter
+    def size(self, value):
+        self._size = value
+        self.update_metrics()
+
+    @property
+    def dpi(self):
+        return self._dpi
+
+    @dpi.setter
+    def dpi(self, value):
+        self._dpi = value
+        self.update_metrics()
+
+    @property
+    def font_id(self):
+        return self._font_id
+
+    @font_id.setter
+    def font_id(self, value):
+        self._font_id = value
+        self.update_metrics()
+
+    def update_metrics(self):
+        """
+        Measure the text again if it or its font, size or dpi changed since
+        it was last measured, and make the morph as big as the text.
+        """
+        key = (self._font_id, self._text, self._size, self._dpi)
+        if key == self._metrics_key:
+            return
+        self._metrics_key = key
+
+        # Measuring needs the size set, tell the World in case it's drawing.
+        if self._world is not None:
+            self._world.gpu_state.font_size(self._font_id, self._size, self._dpi)
+        else:
+            blf.size(self._font_id, self._size, self._dpi)
+        width, height = blf.dimensions(self._font_id, self._text)
+
+        font_key = (self._font_id, self._size, self._dpi)
+        metrics = self.font_metrics.get(font_key)
+        if metrics is None:
+            # H sits on the baseline, g also goes below it.
+            line_height = blf.dimensions(self._font_id, "Hg")[1]
+            metrics = (line_height - blf.dimensions(self._font_id, "H")[1], line_height)
+            self.font_metrics[font_key] = metrics
+        descent, line_height = metrics
+        # Without knowing where the text starts, it may go from the bottom
+        # of the descent as high as its height.
+        height = max(line_height, descent + height)
+        self._descent = descent
+
+        self.invalidate_render_cache()
+        if width != self.real_width:
+            self.width = width
+        if height != self.real_height:
+            self.height = height
+
+    def draw_shape(self, renderer, origin_x, origin_y):
+        """
+        Draw the text, the morph itself has no shape.
+        """
+        if self._transform_dirty:
+            self.update_transform()
+        self.draw_count = self.draw_count + 1
+        renderer.add_text(
+            self._font_id, self._size, self._dpi, origin_x + self._absolute_offset[0],
+            origin_y + self._absolute_offset[1] + self._descent,
+            self.color, self._text, self.real_width, self.real_height)
 
 
 class ButtonMorph(Morph):
@@ -1065,6 +3917,8 @@ class ButtonMorph(Morph):
     the button.
     """
 
+    __slots__ = ('hover_glow_mode',)
+
     def __init__(self, hover_glow_mode=True, **kargs):
         super().__init__(**kargs)
         self.handles_mouse_over = True
@@ -1075,6 +3929,11 @@ class ButtonMorph(Morph):
         # if the mouse is outside its boundaries.
         self.hover_glow_mode = hover_glow_mode
 
+        # The World only tells the button when the mouse enters or leaves it,
+        # so it starts with the appearance of the mouse being outside.
+        if self.hover_glow_mode:
+            self.change_appearance(0)
+
     def on_mouse_in(self):
         if self.hover_glow_mode:
             self.change_appearance(1)
@@ -1089,7 +3948,518 @@ class ButtonMorph(Morph):
         appearance accordingly.
         """
 
-        if value == 0:
-            self.color = (self.color[0], self.color[1], self.color[2], 0.5)
-        if value == 1:
-            self.color = (self.color[0], self.color[1], self.color[2], 1.0)
+        if value not in (0, 1):
+            return
+        alpha = 1.0 if value == 1 else 0.5
+        if self.color[3] != alpha:
+            self.color = (self.color[0], self.color[1], self.color[2], alpha)
+
+
+class ListMorph(Morph):
+    """
+    ListMorph shows a list of items, a row morph for each, scrolled with the
+    mouse wheel. Only the rows inside the list exist as morphs. When the list
+    scrolls, the rows that leave it are reused for the items that come into
+    view, so a list of a hundred thousand items costs about as much to draw
+    and to handle events for as the few dozen rows it shows.
+    items can be any sequence. Rows are made by make_row and shown their item
+    by bind_row, by default TextMorphs showing str(item). Pass row_factory and
+    row_binder, or override the methods, for other rows.
+    Rows are row_height tall, unless row_height_of is given, a function that
+    returns the height of the row of (item, index). It is called once per
+    item, until refresh() is called. The rows at the top and bottom edges may
+    only be partly inside the list, they are clipped to it, for drawing and
+    for events.
+    """
+
+    clips_children = True
+
+    __slots__ = ('_items', 'row_height', 'row_height_of', 'row_factory', 'row_binder',
+                 'wheel_step', '_scroll_offset', '_row_offsets', '_rows', '_row_items')
+
+    def __init__(self, items=(), row_height=20, row_height_of=None, row_factory=None,
+                 row_binder=None, wheel_step=None, **kargs):
+        super().__init__(**kargs)
+        self.handles_events = True
+
+        # The items of the list and how the rows for them are made and shown,
+        # see the class comment. Call refresh() after changing any of them,
+        # except items, which does it itself.
+        self._items = items
+        self.row_height = row_height
+        self.row_height_of = row_height_of
+        self.row_factory = row_factory
+        self.row_binder = row_binder
+
+        # How far the list scrolls for each step of the mouse wheel.
+        if wheel_step is None:
+            wheel_step = row_height * 3
+        self.wheel_step = wheel_step
+
+        # How far the top of the list is below the top of the first row.
+        self._scroll_offset = 0
+
+        # With row_height_of, the distance of the top of each row from the
+        # top of the first row, followed by the height of all rows. Computed
+        # when first needed, see row_offsets().
+        self._row_offsets = None
+
+        # The row morphs, children of the list, and the index of the item
+        # each shows, -1 for the rows not in use, which are hidden.
+        self._rows = []
+        self._row_items = []
+
+        self.update_rows()
+
+    @property
+    def items(self):
+        return self._items
+
+    @items.setter
+    def items(self, value):
+        self._items = value
+        self.refresh()
+
+    @Morph.height.setter
+    def height(self, value):
+        """
+        Change the height of the list, showing as many rows as fit.
+        """
+        Morph.height.fset(self, value)
+        self.update_rows()
+
+    def refresh(self):
+        """
+        Show the items again, after they or the way rows are made or shown
+        changed.
+        """
+        self._row_offsets = None
+        self._row_items = [-1] * len(self._rows)
+        self.update_rows()
+
+    def row_offsets(self):
+        """
+        Return an array with the distance of the top of each row from the top
+        of the first row, followed by the height of all rows, when rows have
+        their own heights.
+        """
+        if self._row_offsets is None:
+            heights = numpy.fromiter(
+                (self.row_height_of(item, index) for index, item in enumerate(self._items)),
+                dtype=numpy.float64, count=len(self._items))
+            offsets = numpy.zeros(len(heights) + 1, dtype=numpy.float64)
+            numpy.cumsum(heights, out=offsets[1:])
+            self._row_offsets = offsets
+        return self._row_offsets
+
+    def content_height(self):
+        """
+        Return the height of all rows together.
+        """
+        if self.row_height_of is None:
+            return len(self._items) * self.row_height
+        return float(self.row_offsets()[-1])
+
+    def row_top(self, index):
+        """
+        Return the distance of the top of the row of item index from the top
+        of the first row.
+        """
+        if self.row_height_of is None:
+            return index * self.row_height
+        return float(self.row_offsets()[index])
+
+    def row_at(self, offset):
+        """
+        Return the index of the item whose row is offset below the top of the
+        first row. Takes constant time with a fixed row_height and a binary
+        search of row_offsets() otherwise.
+        """
+        count = len(self._items)
+        if self.row_height_of is None:
+            index = int(offset // self.row_height)
+        else:
+            index = int(numpy.searchsorted(self.row_offsets(), offset, side='right')) - 1
+        return max(0, min(index, count - 1))
+
+    @property
+    def scroll_offset(self):
+        """
+        Return how far the top of the list is below the top of the first row.
+        """
+        return self._scroll_offset
+
+    @scroll_offset.setter
+    def scroll_offset(self, value):
+        """
+        Scroll the list, value is kept between the first and the last row.
+        """
+        value = max(0, min(value, self.content_height() - self.real_height))
+        if value != self._scroll_offset:
+            self._scroll_offset = value
+            self.update_rows()
+
+    def scroll_to(self, index):
+        """
+        Scroll the least needed to show the whole row of item index.
+        """
+        top = self.row_top(index)
+        bottom = self.row_top(index + 1)
+        if top < self._scroll_offset:
+            self.scroll_offset = top
+        elif bottom > self._scroll_offset + self.real_height:
+            self.scroll_offset = bottom - self.real_height
+
+    def make_row(self):
+        """
+        Return a new row morph.
+        """
+        if self.row_factory is not None:
+            return self.row_factory(self)
+        return TextMorph(text="")
+
+    def bind_row(self, row, item, index):
+        """
+        Make row show item, the item at index.
+        """
+        if self.row_binder is not None:
+            self.row_binder(row, item, index)
+        else:
+            row.text = str(item)
+
+    def update_rows(self):
+        """
+        Show the rows of the items inside the list, reusing the rows of the
+        items that left it. Only the rows inside the list are touched.
+        """
+        items = self._items
+        count = len(items)
+        view_height = self.real_height
+        self._scroll_offset = max(0, min(self._scroll_offset, self.content_height() - view_height))
+        scroll = self._scroll_offset
+
+        # The items inside the list are first to last - 1.
+        first = self.row_at(scroll) if count > 0 else 0
+        last = first
+        bottom = scroll + view_height
+        while last < count and self.row_top(last) < bottom:
+            last += 1
+
+        # Rows still showing an item inside the list keep it.
+        kept = {}
+        free = []
+        for row, index in zip(self._rows, self._row_items):
+            if first <= index < last and index not in kept:
+                kept[index] = row
+            else:
+                free.append(row)
+
+        missing = (last - first) - len(kept) - len(free)
+        if missing > 0:
+            new_rows = [self.make_row() for _ in range(missing)]
+            self.add_morphs(new_rows)
+            free.extend(new_rows)
+
+        rows = []
+        row_items = []
+        for index in range(first, last):
+            row = kept.get(index)
+            if row is None:
+                row = free.pop()
+                self.bind_row(row, items[index], index)
+            top = self.row_top(index)
+            height = self.row_top(index + 1) - top
+            position = [0, view_height - (top - scroll) - height]
+            if row.real_position[0] != position[0] or row.real_position[1] != position[1]:
+                row.position = position
+            if row._is_hidden:
+                row.is_hidden = False
+            rows.append(row)
+            row_items.append(index)
+
+        for row in free:
+            if not row._is_hidden:
+                row.is_hidden = True
+            rows.append(row)
+            row_items.append(-1)
+
+        self._rows = rows
+        self._row_items = row_items
+
+    def draw_children(self, context):
+        """
+        Draw the rows clipped to the list.
+        """
+        self.draw_clipped_children(context, self.children)
+
+    def get_content_candidates(self, x, y):
+        """
+        Return the visible rows handling events, and the morphs inside them,
+        whose bounds contain the point (x, y) of the World, if it's inside the
+        list. See ScrollMorph.get_content_candidates.
+        """
+        if self._transform_dirty:
+            self.update_transform()
+        left, bottom = self._absolute_offset
+        width, height = self.shape_size()
+        if not (left <= x <= left + width and bottom <= y <= bottom + height):
+            return []
+        return self.get_clipped_candidates(self.children, x, y)
+
+    def on_mouse_wheel(self, event):
+        """
+        Scroll by wheel_step. The event goes on to the morphs below if the
+        list can't scroll further.
+        """
+        old_offset = self._scroll_offset
+        if event.type == 'WHEELUPMOUSE':
+            self.scroll_offset = old_offset - self.wheel_step
+        else:
+            self.scroll_offset = old_offset + self.wheel_step
+        if self._scroll_offset != old_offset:
+            self.world.consumed_event = True
+
+
+class ScrollMorph(Morph):
+    """
+    ScrollMorph shows its children through a window the size of the morph,
+    clipping what is outside it, and scrolls them with the mouse wheel, or
+    sideways with shift. Scrolling changes a single offset the children get
+    through their cached transform, the same way they get the position of
+    their parent, so no child is moved. Only the children inside the window
+    are drawn and get events, found through a grid of their bounds which
+    scrolling doesn't change, and scrolling only has to update the children
+    placed since the last scroll, so it costs as much as the children shown,
+    not as all of them.
+    """
+
+    clips_children = True
+
+    __slots__ = ('wheel_step', '_scroll_position', '_content_offset', '_placed_children',
+                 '_content_index', '_content_order', '_content_bounds', '_clip_bounds')
+
+    def __init__(self, wheel_step=30, **kargs):
+        # How far the children are scrolled for each step of the mouse wheel.
+        self.wheel_step = wheel_step
+
+        # The point of the children at the lower left corner of the window,
+        # in the coordinates of their positions, and the offset it gives them.
+        self._scroll_position = (0, 0)
+        self._content_offset = (0, 0)
+
+        # The children whose transform was computed since the last scroll.
+        # The transform of the others is outdated already.
+        self._placed_children = set()
+
+        # A SpatialGrid of the bounds the children take in the morph, not
+        # scrolled, the place of each child among the children and the bounds
+        # of all of them. None when a child has changed, see get_content_index().
+        self._content_index = None
+        self._content_order = None
+        self._content_bounds = None
+
+        # The local bounds, only the morph itself since children are clipped.
+        self._clip_bounds = None
+
+        super().__init__(**kargs)
+        self.handles_events = True
+
+    @property
+    def scroll_position(self):
+        """
+        Return the point of the children at the lower left corner of the window.
+        """
+        return self._scroll_position
+
+    @scroll_position.setter
+    def scroll_position(self, value):
+        """
+        Scroll so the point value of the children is at the lower left corner
+        of the window. It's kept inside the bounds of the children.
+        """
+        value = self.clamp_scroll_position(value[0], value[1])
+        if value != self._scroll_position:
+            self._scroll_position = value
+            self.update_content_offset()
+
+    def scroll_by(self, x, y):
+        """
+        Scroll the children by (x, y), return True if they moved.
+        """
+        old = self._scroll_position
+        self.scroll_position = (old[0] + x, old[1] + y)
+        return self._scroll_position != old
+
+    def clamp_scroll_position(self, x, y):
+        """
+        Return (x, y) moved inside the range the window can scroll over, the
+        bounds of the children and the place of the window when not scrolled.
+        """
+        self.get_content_index()
+        bounds = self._content_bounds
+        scale = self.get_absolute_scale()
+        if bounds is None or scale == 0:
+            return (0, 0)
+        x = max(min(0, bounds[0] / scale), min(x, max(0, bounds[2] / scale - self.real_width)))
+        y = max(min(0, bounds[1] / scale), min(y, max(0, bounds[3] / scale - self.real_height)))
+        return (x, y)
+
+    def update_content_offset(self):
+        """
+        Internal, give the children the offset of the scroll position.
+        """
+        scale = self.get_absolute_scale()
+        offset = (-self._scroll_position[0] * scale, -self._scroll_position[1] * scale)
+        if offset != self._content_offset:
+            self._content_offset = offset
+            self.invalidate_placed_children()
+            self.invalidate_render_cache()
+
+    def invalidate_placed_children(self):
+        """
+        Internal, mark the transform of the children placed since the last
+        scroll as outdated.
+        """
+        placed = self._placed_children
+        self._placed_children = set()
+        for child in placed:
+            if child._parent is self:
+                child.invalidate_transform()
+
+    def update_transform(self):
+        super().update_transform()
+        # The offset is scaled with the morph.
+        self.update_content_offset()
+
+    def invalidate_transform(self):
+        """
+        Like Morph.invalidate_transform, but only the children placed since
+        the last scroll need to be told, the others are outdated already.
+        """
+        if self._transform_dirty:
+            return
+        self._transform_dirty = True
+        if self._world is not None:
+            self._world._index_dirty.add(self)
+        self.invalidate_placed_children()
+
+    def get_local_bounds(self):
+        """
+        Return the bounds of the morph alone, its children are clipped.
+        """
+        if self._transform_dirty:
+            self.update_transform()
+        # A change in a child either marks the bounds as outdated or replaces
+        # them, see child_bounds_changed of Morph.
+        if self._bounds_dirty or self._local_bounds is not self._clip_bounds:
+            width, height = self.shape_size()
+            self._clip_bounds = [0, 0, width, height]
+            self._local_bounds = self._clip_bounds
+            self._bounds_dirty = False
+            self._content_index = None
+        return self._local_bounds
+
+    def child_bounds_changed(self, old, new):
+        """
+        A child changed, the bounds of the morph stay the same.
+        """
+        if old != new:
+            self._content_index = None
+
+    def invalidate_display_list(self):
+        self._content_index = None
+        super().invalidate_display_list()
+
+    def get_content_index(self):
+        """
+        Return the SpatialGrid of the bounds of the visible children, building
+        it again if any child has changed.
+        """
+        # Finds out about changed children.
+        self.get_local_bounds()
+        if self._content_index is not None:
+            return self._content_index
+
+        index = SpatialGrid()
+        order = {}
+        all_bounds = None
+        for place, child in enumerate(self.children):
+            order[child] = place
+            bounds = child.get_parent_bounds()
+            if bounds is None:
+                continue
+            index.insert(child, bounds)
+            if all_bounds is None:
+                all_bounds = list(bounds)
+            else:
+                all_bounds = [min(all_bounds[0], bounds[0]), min(all_bounds[1], bounds[1]),
+                              max(all_bounds[2], bounds[2]), max(all_bounds[3], bounds[3])]
+        self._content_index = index
+        self._content_order = order
+        self._content_bounds = all_bounds
+        return index
+
+    def get_visible_children(self):
+        """
+        Return the visible children inside the window, bottom first.
+        """
+        index = self.get_content_index()
+        width, height = self.shape_size()
+        x1 = -self._content_offset[0]
+        y1 = -self._content_offset[1]
+        x2 = x1 + width
+        y2 = y1 + height
+        children = []
+        for child in index.query_rect([x1, y1, x2, y2]):
+            bounds = child._parent_bounds
+            if (bounds is not None and not child._is_hidden and bounds[2] > x1 and
+                    bounds[0] < x2 and bounds[3] > y1 and bounds[1] < y2):
+                children.append(child)
+        order = self._content_order
+        children.sort(key=order.__getitem__)
+        return children
+
+    def draw_children(self, context):
+        """
+        Draw the children inside the window, clipped to it.
+        """
+        children = self.get_visible_children()
+        if len(children) > 0:
+            self.draw_clipped_children(context, children)
+
+    def get_content_candidates(self, x, y):
+        """
+        Return the visible morphs handling events inside the morph whose
+        bounds contain the point (x, y) of the World, the candidates
+        World.get_morphs_under_mouse tests against their exact shape.
+        """
+        if self._transform_dirty:
+            self.update_transform()
+        left, bottom = self._absolute_offset
+        width, height = self.shape_size()
+        if not (left <= x <= left + width and bottom <= y <= bottom + height):
+            return []
+
+        # The point in the coordinates of the grid.
+        content_x = x - left - self._content_offset[0]
+        content_y = y - bottom - self._content_offset[1]
+        children = []
+        for child in self.get_content_index().query_point(content_x, content_y):
+            bounds = child._parent_bounds
+            if (bounds is not None and bounds[0] <= content_x <= bounds[2] and
+                    bounds[1] <= content_y <= bounds[3]):
+                children.append(child)
+        return self.get_clipped_candidates(children, x, y)
+
+    def on_mouse_wheel(self, event):
+        """
+        Scroll by wheel_step, up and down or sideways with shift. The event
+        goes on to the morphs below if the children can't scroll further.
+        """
+        step = self.wheel_step if event.type == 'WHEELUPMOUSE' else -self.wheel_step
+        if event.shift:
+            moved = self.scroll_by(-step, 0)
+        else:
+            moved = self.scroll_by(0, step)
+        if moved:
+            self.world.consumed_event = True
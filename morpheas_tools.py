@@ -3,6 +3,8 @@ Some necessary functions for Morpheas to work correctly.
 """
 
 import math
+from functools import lru_cache
+import numpy
 import bpy
 import gpu
 from gpu_extras.batch import batch_for_shader
@@ -12,6 +14,8 @@ import bpy_extras
 def drawRegion(points, color):
     """
     Draw a simple shape with given points and color.
+    Morphs drawn by a World don't use this, their shapes are collected
+    by the World's Renderer and drawn together.
     """
     shader = gpu.shader.from_builtin('2D_UNIFORM_COLOR')
 
@@ -110,11 +114,154 @@ def pointsDistance(point1x, point1y, point2x, point2y):
     return distance
 
 
+def shapeDistance(x, y, width, height, radii):
+    """
+    Given a point relative to the lower left corner of a rectangle, return its
+    signed distance to the edge of the rectangle, negative inside and positive
+    outside. The corners are rounded by radii, in the order
+    [lower_left, upper_left, upper_right, lower_right], so a square with all
+    radii half its width is a circle. This is the same test the shape shader
+    of the Renderer does for every pixel.
+    """
+    half_width = width / 2.0
+    half_height = height / 2.0
+    px = x - half_width
+    py = y - half_height
+    if px < 0.0:
+        radius = radii[0] if py < 0.0 else radii[1]
+    else:
+        radius = radii[2] if py > 0.0 else radii[3]
+    radius = min(radius, half_width, half_height)
+    qx = abs(px) - half_width + radius
+    qy = abs(py) - half_height + radius
+    outside = math.hypot(max(qx, 0.0), max(qy, 0.0))
+    return min(max(qx, qy), 0.0) + outside - radius
+
+
 def collisionDetect(x1, y1, x2, y2, w1, h1, w2, h2):
     """
     Given x and y of two rectangles and their width and height detect if
-    they collide.
+    they collide. A rectangle inside the other collides with it, rectangles
+    that only touch at their edges don't.
+    """
+    return x1 < x2 + w2 and x2 < x1 + w1 and y1 < y2 + h2 and y2 < y1 + h1
+
+
+# The functions below are vectorized versions of the ones above. They work on
+# many shapes at once and take and return NumPy float32 arrays, which the
+# Renderer sends to the GPU as they are.
+
+def drawArcs(cx, cy, r, startAngle, arcAngle, numSegments):
+    """
+    Compute the points of many arcs at once, like drawArc.
+    cx, cy, r, startAngle and arcAngle can be numbers or arrays of N values.
+    Returns an array of shape (N, numSegments, 2).
+    """
+    cx, cy, r, startAngle, arcAngle = numpy.broadcast_arrays(
+        *[numpy.atleast_1d(numpy.asarray(value, dtype=numpy.float64))
+          for value in (cx, cy, r, startAngle, arcAngle)])
+    steps = numpy.linspace(0.0, 1.0, numSegments)
+    angles = startAngle[:, None] + arcAngle[:, None] * steps[None, :]
+    verts = numpy.empty((len(cx), numSegments, 2), dtype=numpy.float32)
+    verts[..., 0] = cx[:, None] + r[:, None] * numpy.cos(angles)
+    verts[..., 1] = cy[:, None] + r[:, None] * numpy.sin(angles)
+    return verts
+
+
+def drawCircles(cx, cy, r, numSegments):
+    """
+    Compute the points of many circles at once.
+    Returns an array of shape (N, numSegments, 2).
+    """
+    cx, cy, r = numpy.broadcast_arrays(
+        *[numpy.atleast_1d(numpy.asarray(value, dtype=numpy.float64))
+          for value in (cx, cy, r)])
+    angles = numpy.arange(numSegments) * (2.0 * math.pi / numSegments)
+    verts = numpy.empty((len(cx), numSegments, 2), dtype=numpy.float32)
+    verts[..., 0] = cx[:, None] + r[:, None] * numpy.cos(angles)[None, :]
+    verts[..., 1] = cy[:, None] + r[:, None] * numpy.sin(angles)[None, :]
+    return verts
+
+
+def roundCornersBatch(x1, y1, x2, y2, value, steps, corners=(True, True, True, True)):
+    """
+    Compute the outlines of many rectangles with round corners at once, like
+    roundCorners. x1, y1, x2, y2 and value can be numbers or arrays of N values
+    and corners a list of 4 flags or an array of N of them. Every corner gets
+    steps points, corners that are not rounded repeat the corner point, so
+    all outlines have the same number of points.
+    Returns an array of shape (N, 4 * steps, 2).
+    """
+    x1, y1, x2, y2, value = numpy.broadcast_arrays(
+        *[numpy.atleast_1d(numpy.asarray(v, dtype=numpy.float64))
+          for v in (x1, y1, x2, y2, value)])
+    corners = numpy.broadcast_to(numpy.asarray(corners, dtype=bool), (len(x1), 4))
+    radius = numpy.where(corners, value[:, None], 0.0)
+
+    # Lower left, upper left, upper right, lower right, the same order and
+    # direction as roundCorners.
+    cx = numpy.stack((x1 + radius[:, 0], x1 + radius[:, 1],
+                      x2 - radius[:, 2], x2 - radius[:, 3]), axis=1)
+    cy = numpy.stack((y1 + radius[:, 0], y2 - radius[:, 1],
+                      y2 - radius[:, 2], y1 + radius[:, 3]), axis=1)
+    start = numpy.array([1.5 * math.pi, math.pi, 0.5 * math.pi, 0.0])
+
+    arcs = drawArcs(cx.ravel(), cy.ravel(), radius.ravel(),
+                    numpy.tile(start, len(x1)), -0.5 * math.pi, steps)
+    return arcs.reshape(len(x1), 4 * steps, 2)
+
+
+def shapeDistances(x, y, sx, sy, width, height, radii):
+    """
+    Return the signed distances from the point (x, y) to the edges of N
+    shapes, like shapeDistance. sx, sy, width and height are arrays with the
+    lower left corners and the sizes of the shapes, radii an (N, 4) array.
+    """
+    sx, sy, width, height = [numpy.asarray(v, dtype=numpy.float32)
+                             for v in (sx, sy, width, height)]
+    radii = numpy.asarray(radii, dtype=numpy.float32).reshape(-1, 4)
+    half_width = width / 2.0
+    half_height = height / 2.0
+    px = x - sx - half_width
+    py = y - sy - half_height
+    radius = numpy.where(
+        px < 0.0,
+        numpy.where(py < 0.0, radii[:, 0], radii[:, 1]),
+        numpy.where(py > 0.0, radii[:, 2], radii[:, 3]))
+    radius = numpy.minimum(radius, numpy.minimum(half_width, half_height))
+    qx = numpy.abs(px) - half_width + radius
+    qy = numpy.abs(py) - half_height + radius
+    outside = numpy.hypot(numpy.maximum(qx, 0.0), numpy.maximum(qy, 0.0))
+    return numpy.minimum(numpy.maximum(qx, qy), 0.0) + outside - radius
+
+
+def pointInShapes(x, y, sx, sy, width, height, radii):
+    """
+    Return an array of N booleans, True for each shape that contains (x, y).
+    """
+    return shapeDistances(x, y, sx, sy, width, height, radii) <= 0.0
+
+
+def collisionDetectMany(x1, y1, w1, h1, x2, y2, w2, h2):
+    """
+    Given one rectangle and arrays of N other rectangles, return an array of N
+    booleans, True for each rectangle that collides with the first one, with
+    the same rules as collisionDetect.
+    """
+    x2, y2, w2, h2 = [numpy.asarray(v, dtype=numpy.float32) for v in (x2, y2, w2, h2)]
+    return (x1 < x2 + w2) & (x2 < x1 + w1) & (y1 < y2 + h2) & (y2 < y1 + h1)
+
+
+@lru_cache(maxsize=None)
+def fanIndices(count):
+    """
+    Return the triangle indices of a triangle fan of count points as an
+    (count - 2, 3) int32 array. The array is shared, don't modify it.
     """
-    if x1 > x2 and x1 < x2 + w2 or x1 + w1 > x2 and x1 + w1 < x2 + w2:
-        if y1 > y2 and y1 < y2 + h2 or y1 + h1 > y2 and y1 + h1 < y2 + h2:
-            return True
+    second = numpy.arange(1, count - 1, dtype=numpy.int32)
+    indices = numpy.empty((count - 2, 3), dtype=numpy.int32)
+    indices[:, 0] = 0
+    indices[:, 1] = second
+    indices[:, 2] = second + 1
+    indices.flags.writeable = False
+    return indices